@@ -2,14 +2,21 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 import uvicorn
 import yaml
 from pathlib import Path
+import argparse
+import asyncio
+import contextlib
 import os
+import json
+import signal
 
 from mcp.context import MCPContext
-from mcp.registry import register_all_tools
+from mcp.registry import preload_plugins, register_all_tools
 
 # === 配置加载 ===
 api_key_file = Path("configs/api_keys.yaml")
@@ -19,11 +26,67 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", api_keys.get("deepseek", "sk-..."))
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", api_keys.get("openai_base_url", "https://api.deepseek.com/v1"))
 
 # === 初始化 MCP 系统 ===
+# mcp 只保存所有请求共享的只读部分，每次请求在 abuild_prompt 内部使用独立的会话对象
 mcp = MCPContext(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 register_all_tools(mcp)
 
+# 预先加载只读共享状态（工具 schema、检索索引、分词器、配置）
+# 多 worker 模式（gunicorn.conf.py，preload_app）下在主进程 fork 之前执行，worker 直接继承
+mcp.warmup()
+if os.getenv("MCP_PRELOAD"):
+    preload_plugins()
+
+# 就绪状态：worker 建立到模型服务的连接后才就绪；收到 SIGTERM 后进入 draining，不再就绪
+state = {"ready": False, "draining": False}
+DRAIN_SECONDS = float(os.getenv("MCP_DRAIN_SECONDS", "0"))  # 收到 SIGTERM 后继续接收请求的时间，留给负载均衡器摘除本实例
+
+async def _warm_connections():
+    delay = 0.5
+    while not state["ready"] and not state["draining"]:
+        try:
+            await mcp.awarmup()
+            state["ready"] = True
+            print(f"[READY] worker {os.getpid()} 已连接模型服务")
+        except Exception as e:
+            print(f"[WARN] 连接模型服务失败，{delay:.1f}s 后重试：{e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+def _install_drain_handler():
+    """
+    在 uvicorn 的 SIGTERM 处理之前插入一步：先标记 draining（/ready 返回 503），
+    DRAIN_SECONDS 秒后再交给 uvicorn 停止接收新连接，并等待进行中的请求完成
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        return
+    loop = asyncio.get_running_loop()
+
+    def handle(sig, frame):
+        if state["draining"]:
+            previous(sig, frame)
+            return
+        state["draining"] = True
+        print(f"[INFO] worker {os.getpid()} 开始 draining（{DRAIN_SECONDS}s 后停止接收新连接）")
+        if DRAIN_SECONDS > 0:
+            loop.call_soon_threadsafe(loop.call_later, DRAIN_SECONDS, previous, sig, frame)
+        else:
+            previous(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # 启动：接管 SIGTERM 以便 draining，后台建立到模型服务的连接（就绪后 /ready 返回 200）
+    _install_drain_handler()
+    warmup_task = asyncio.create_task(_warm_connections())
+    yield
+    # 关闭：停止重试，关闭当前事件循环上的 HTTP 客户端
+    warmup_task.cancel()
+    await mcp.http.aclose()
+
 # === 初始化 FastAPI 应用 ===
-app = FastAPI(title="MCP Chat API")
+app = FastAPI(title="MCP Chat API", lifespan=lifespan)
 
 # 允许所有跨域（适用于前端测试）
 app.add_middleware(
@@ -33,17 +96,92 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.get("/health")
+async def health_endpoint():
+    """存活检查：进程能响应即返回 200"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def ready_endpoint():
+    """就绪检查：已建立到模型服务的连接且未在 draining 时返回 200，否则返回 503"""
+    if state["ready"] and not state["draining"]:
+        return {"status": "ready", "pid": os.getpid()}
+    status = "draining" if state["draining"] else "starting"
+    return JSONResponse({"status": status, "pid": os.getpid()}, status_code=503)
+
 # === 接口模型 ===
 class ChatRequest(BaseModel):
     user_input: str
+    session_id: Optional[str] = None  # 不传则为一次性会话，不保留记忆
+    tools: Optional[List[str]] = None  # 只向模型提供这些工具，不传则提供全部
+    llm_cache: Literal["use", "bypass", "refresh"] = "use"  # 规划阶段模型调用缓存：use / bypass（不读不写）/ refresh（重新调用并覆盖）
 
 @app.post("/chat")
-def chat_endpoint(req: ChatRequest):
-    result = mcp.build_prompt(req.user_input)
+async def chat_endpoint(req: ChatRequest):
+    result = await mcp.abuild_prompt(
+        req.user_input, session_id=req.session_id, tool_names=req.tools, llm_cache=req.llm_cache
+    )
     return {
         "response": result
     }
 
+class ChatStreamRequest(ChatRequest):
+    answer: bool = True  # 是否在 context 之后继续流式输出 final_response 模型的回答
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatStreamRequest):
+    """
+    SSE 流式接口：依次推送 modules、tool_start、tool_end、context、token、done 事件
+    """
+    async def event_stream():
+        async for event, data in mcp.astream_prompt(
+            req.user_input, session_id=req.session_id, answer=req.answer, tool_names=req.tools,
+            llm_cache=req.llm_cache
+        ):
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class ChatBatchRequest(BaseModel):
+    inputs: List[str]
+    tools: Optional[List[str]] = None
+    concurrency: int = Field(8, ge=1, le=64)  # 同时处理的输入数
+    llm_cache: Literal["use", "bypass", "refresh"] = "use"
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(req: ChatBatchRequest):
+    """
+    批量接口：并发处理多个输入，按完成顺序逐行返回 NDJSON
+    每行 {"index": 输入序号, "response": prompt} 或 {"index": 输入序号, "error": 错误信息}
+    """
+    async def result_stream():
+        async for index, prompt, error in mcp.abuild_prompts(
+            req.inputs, concurrency=req.concurrency, tool_names=req.tools, llm_cache=req.llm_cache
+        ):
+            item = {"index": index, "error": error} if error else {"index": index, "response": prompt}
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus 指标：各阶段耗时、工具耗时/结果、缓存命中、模型 token 用量等"""
+    return PlainTextResponse(mcp.metrics.render(), media_type="text/plain; version=0.0.4")
+
 # === 启动 ===
+# 开发：python api_server.py（单进程，自动重载）
+# 生产：python api_server.py --prod [--workers N]，等价于 gunicorn -c gunicorn.conf.py api_server:app
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MCP Chat API")
+    parser.add_argument("--prod", action="store_true", help="多 worker 生产模式（gunicorn + uvicorn worker，预加载后 fork）")
+    parser.add_argument("--workers", type=int, default=None, help="worker 数，默认按可用 CPU 核数")
+    args = parser.parse_args()
+    if args.prod:
+        if args.workers:
+            os.environ["WEB_CONCURRENCY"] = str(args.workers)
+        os.execvp("gunicorn", ["gunicorn", "-c", "gunicorn.conf.py", "api_server:app"])
     uvicorn.run("api_server:app", host="0.0.0.0", port=8000, reload=True)
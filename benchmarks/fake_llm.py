@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 本地假 OpenAI 兼容服务（POST /v1/chat/completions），供基准测试离线运行
+# - latency / jitter: 每次请求的模拟延迟（秒）
+# - tool_calls: 带 tools 的请求固定返回的工具调用 [{"name": ..., "arguments": {...}}]
+# - 模块调度请求返回提示词中列出的全部模块；json_object 请求返回单次调用规划；stream=True 时按 SSE 分片返回
+# 单独运行：python -m benchmarks.fake_llm --port 9000 --latency 0.2
+# 然后设置 OPENAI_BASE_URL=http://127.0.0.1:9000/v1 启动 api_server.py
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TOOL_CALLS = [
+    {"name": "get_weather", "arguments": {"city": "北京"}},
+    {"name": "search_wikipedia", "arguments": {"query": "北京"}}
+]
+DEFAULT_ANSWER = "北京今天晴，气温 20°C。北京是中华人民共和国的首都。"
+_MODULE_LINE = re.compile(r"^- ([^:\s]+):", re.M)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # 默认的 5 在高并发下会导致连接被拒后约 1 秒的重试延迟
+
+
+def _usage(messages, completion):
+    prompt_tokens = sum(len(str(m.get("content") or "")) for m in messages) // 2 + 1
+    completion_tokens = len(completion) // 2 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+class FakeLLMServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0,
+                 tool_calls=None, answer=DEFAULT_ANSWER):
+        self.latency = latency
+        self.jitter = jitter
+        self.tool_calls = DEFAULT_TOOL_CALLS if tool_calls is None else tool_calls
+        self.answer = answer
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sleep(self):
+        delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def respond(self, body):
+        """根据请求内容构造非流式响应"""
+        messages = body.get("messages") or []
+        message = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+        if body.get("tools"):
+            available = {t["function"]["name"] for t in body["tools"]}
+            calls = [c for c in self.tool_calls if c["name"] in available]
+            if calls:
+                message["tool_calls"] = [
+                    {
+                        "id": f"call_{i}",
+                        "type": "function",
+                        "function": {"name": c["name"], "arguments": json.dumps(c["arguments"], ensure_ascii=False)}
+                    }
+                    for i, c in enumerate(calls)
+                ]
+                finish_reason = "tool_calls"
+            else:
+                message["content"] = ""
+        elif (body.get("response_format") or {}).get("type") == "json_object":
+            prompt = str(messages[-1].get("content")) if messages else ""
+            message["content"] = json.dumps({
+                "modules": _MODULE_LINE.findall(prompt),
+                "tool_calls": self.tool_calls
+            }, ensure_ascii=False)
+        elif any("模块调度器" in str(m.get("content")) for m in messages):
+            prompt = str(messages[-1].get("content")) if messages else ""
+            message["content"] = json.dumps(_MODULE_LINE.findall(prompt), ensure_ascii=False)
+        else:
+            message["content"] = self.answer
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": _usage(messages, message["content"] or json.dumps(message.get("tool_calls", [])))
+        }
+
+    def stream_chunks(self, body):
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake")
+        }
+        pieces = [self.answer[i:i + 8] for i in range(0, len(self.answer), 8)]
+        for piece in pieces:
+            yield dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield dict(base, choices=[], usage=_usage(body.get("messages") or [], self.answer))
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                server._sleep()
+
+                if not body.get("stream"):
+                    self._send_json(200, server.respond(body))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in server.stream_chunks(body):
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地假 OpenAI 兼容服务")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tool-calls", default=None, help='JSON，如 [{"name": "get_weather", "arguments": {"city": "北京"}}]')
+    args = parser.parse_args()
+
+    fake = FakeLLMServer(
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        tool_calls=json.loads(args.tool_calls) if args.tool_calls else None
+    )
+    print(f"假 OpenAI 服务已启动：{fake.base_url}（延迟 {args.latency}s）")
+    fake._server.serve_forever()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 离线基准测试：假 OpenAI 服务 + 桩工具，不需要 API key 和外网
+# - build_prompt: 给定并发下的吞吐量和延迟分位数
+# - generate_context: 耗时随模块数量和模块大小的变化（cold: 内容变化需重新格式化和计数；warm: 命中缓存）
+# - chat: /chat 接口在不同并发下的吞吐量
+# - encoders: 各上下文序列化格式（mcp/encoders.py）对每个模块的字节数、token 数和编码耗时
+# 在仓库根目录运行：
+#   python -m benchmarks.run --save benchmarks/baselines/local.json
+#   python -m benchmarks.run --compare benchmarks/baselines/local.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.stub_tools import register_stub_tools
+from mcp.context import MCPContext
+from mcp.encoders import ENCODERS, encode
+
+SUITES = ("build_prompt", "generate_context", "chat", "encoders")
+
+
+def summarize(latencies, elapsed):
+    """延迟列表（秒）-> 吞吐量和分位数（毫秒）"""
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))] * 1000
+
+    return {
+        "throughput_rps": round(len(ordered) / elapsed, 2),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(percentile(0.50), 2),
+        "p90_ms": round(percentile(0.90), 2),
+        "p99_ms": round(percentile(0.99), 2)
+    }
+
+
+async def _drive(make_call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await make_call(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def _register_bench_modules(mcp, count, size):
+    for i in range(count):
+        mcp.register_module(
+            f"doc_{i}",
+            content_fn=lambda i=i: f"背景资料 {i}：" + ("北京是中国的首都 Beijing is the capital. " * size)[:size],
+            priority=1 + i % 3,
+            description=f"背景资料 {i}"
+        )
+
+
+def make_context(base_url, args):
+    mcp = MCPContext(api_key="sk-bench", base_url=base_url)
+    mcp.completion_cache = None  # 每次都实际调用假模型服务，结果不受之前运行的缓存影响
+    register_stub_tools(mcp, latency=args.tool_latency)
+    mcp.register_module(
+        "memory",
+        lambda: "\n".join(mcp.memory.get_recent(5)),
+        priority=2,
+        description="记录用户最近的说话内容",
+        version_fn=mcp.memory.version
+    )
+    _register_bench_modules(mcp, args.modules, 400)
+    return mcp
+
+
+def bench_build_prompt(base_url, args):
+    mcp = make_context(base_url, args)
+
+    async def call(i):
+        # 每个请求输入不同、使用一次性会话，避免命中决策缓存和共享记忆
+        await mcp.abuild_prompt(f"第 {i} 个问题：北京天气怎么样？", session_id=None)
+
+    async def run():
+        await call(-1)  # 预热连接
+        return await _drive(call, args.requests, args.concurrency)
+
+    result = asyncio.run(run())
+    return {f"build_prompt.c{args.concurrency}.{k}": v for k, v in result.items()}
+
+
+def bench_generate_context(args):
+    results = {}
+    for count in args.module_counts:
+        for size in args.module_sizes:
+            mcp = MCPContext(api_key="sk-bench", base_url="http://127.0.0.1:9/v1")
+            mcp.max_token_limit = 10 ** 9  # 只测量求值、格式化和计数，不让打包阶段丢弃模块
+            version = {"value": 0}
+            for i in range(count):
+                mcp.register_module(
+                    f"doc_{i}",
+                    content_fn=lambda i=i: f"资料 {i}-{version['value']}：" + ("上下文 context " * size)[:size],
+                    priority=1 + i % 3,
+                    description=f"资料 {i}",
+                    version_fn=lambda: version["value"]
+                )
+
+            cold = []
+            for _ in range(args.iterations):
+                version["value"] += 1
+                session = mcp.new_session("bench", session_id=None)
+                start = time.perf_counter()
+                mcp.generate_context(session)
+                cold.append(time.perf_counter() - start)
+
+            warm = []
+            for _ in range(args.iterations):
+                session = mcp.new_session("bench", session_id=None)
+                start = time.perf_counter()
+                mcp.generate_context(session)
+                warm.append(time.perf_counter() - start)
+
+            prefix = f"generate_context.m{count}.s{size}"
+            results[f"{prefix}.cold_ms"] = round(statistics.median(cold) * 1000, 3)
+            results[f"{prefix}.warm_ms"] = round(statistics.median(warm) * 1000, 3)
+    return results
+
+
+def bench_chat(base_url, args):
+    import httpx
+
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["OPENAI_BASE_URL"] = base_url
+    import api_server
+
+    api_server.mcp.completion_cache = None
+    register_stub_tools(api_server.mcp, latency=args.tool_latency)
+
+    async def run():
+        results = {}
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            async def call(i):
+                res = await client.post("/chat", json={"user_input": f"第 {i} 个问题：北京天气怎么样？"})
+                res.raise_for_status()
+
+            await call(-1)
+            for concurrency in args.chat_concurrency:
+                result = await _drive(call, max(args.requests, concurrency * 4), concurrency)
+                results.update({f"chat.c{concurrency}.{k}": v for k, v in result.items()})
+        return results
+
+    return asyncio.run(run())
+
+
+def _sample_modules(mcp):
+    """典型的字典模块：工具列表和几种工具结果"""
+    return {
+        "tools": mcp.tool_schema.available_functions,
+        "tool_result_get_weather": {
+            "location": "Beijing", "temperature_C": "20", "humidity": "40", "description": "Sunny", "wind_kph": "11"
+        },
+        "tool_result_route_plan": {
+            "origin": "北京市朝阳区望京", "destination": "北京市海淀区颐和园", "city": "北京",
+            "duration_min": 62.5, "distance_km": 21.3,
+            "segments": ["地铁14号线（望京 ➜ 东湖渠）", "地铁15号线（东湖渠 ➜ 清华东路西口）", "运通118路（清华东路西口 ➜ 颐和园北宫门）"]
+        },
+        "tool_result_get_news_headlines": {
+            "topic": "technology",
+            "headlines": [
+                {"title": f"科技新闻标题 {i}", "description": "新闻摘要 " * 8, "url": f"https://news.example.com/{i}",
+                 "published": "2026-10-18 08:00:00 +0000"}
+                for i in range(10)
+            ]
+        }
+    }
+
+
+def bench_encoders(args):
+    mcp = MCPContext(api_key="sk-bench", base_url="http://127.0.0.1:9/v1")
+    register_stub_tools(mcp)
+    model = mcp.router.get_model_for("final_response")
+    results = {}
+    totals = {}
+    for module, content in _sample_modules(mcp).items():
+        for encoder in ENCODERS:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                text = encode(encoder, module, content)
+            elapsed = (time.perf_counter() - start) / args.iterations
+            tokens = mcp.token_counter.count(text, model)
+            prefix = f"encoders.{encoder}.{module}"
+            results[f"{prefix}.bytes"] = len(text.encode("utf-8"))
+            results[f"{prefix}.tokens"] = tokens
+            results[f"{prefix}.encode_us"] = round(elapsed * 1e6, 1)
+            total = totals.setdefault(encoder, {"bytes": 0, "tokens": 0})
+            total["bytes"] += len(text.encode("utf-8"))
+            total["tokens"] += tokens
+    for encoder, total in totals.items():
+        results[f"encoders.{encoder}.total.bytes"] = total["bytes"]
+        results[f"encoders.{encoder}.total.tokens"] = total["tokens"]
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线比较，返回退化的指标列表；*_rps 越大越好，其余（耗时）越小越好"""
+    regressions = []
+    for key, value in results.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        change = (value - old) / old
+        worse = change < -threshold if key.endswith("_rps") else change > threshold
+        flag = "  ⚠️ 退化" if worse else ""
+        print(f"{key:<48} {old:>12} -> {value:<12} {change:+.1%}{flag}")
+        if worse:
+            regressions.append(key)
+    return regressions
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MCP 离线基准测试")
+    parser.add_argument("--suite", default=",".join(SUITES), help=f"逗号分隔，可选 {', '.join(SUITES)}")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="假模型服务每次请求的延迟（秒）")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="桩工具每次调用的延迟（秒）")
+    parser.add_argument("--tool-calls", default=None, help="带 tools 的请求返回的工具调用（JSON）")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--chat-concurrency", type=_int_list, default=[1, 4, 16, 64])
+    parser.add_argument("--modules", type=int, default=4, help="build_prompt/chat 中额外注册的背景模块数")
+    parser.add_argument("--module-counts", type=_int_list, default=[4, 16, 64])
+    parser.add_argument("--module-sizes", type=_int_list, default=[200, 2000])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--save", default=None, help="把结果保存为基线文件")
+    parser.add_argument("--compare", default=None, help="与基线文件比较，出现退化时返回非零退出码")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化的相对变化阈值")
+    args = parser.parse_args(argv)
+    suites = [s for s in args.suite.split(",") if s]
+
+    results = {}
+    with FakeLLMServer(
+        latency=args.llm_latency,
+        jitter=args.llm_jitter,
+        tool_calls=json.loads(args.tool_calls) if args.tool_calls else None
+    ) as fake:
+        if "build_prompt" in suites:
+            results.update(bench_build_prompt(fake.base_url, args))
+        if "generate_context" in suites:
+            results.update(bench_generate_context(args))
+        if "chat" in suites:
+            results.update(bench_chat(fake.base_url, args))
+        if "encoders" in suites:
+            results.update(bench_encoders(args))
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({
+            "meta": {
+                "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("save", "compare")}
+            },
+            "results": results
+        }, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"已保存基线：{path}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"[WARN] {len(regressions)} 项指标退化超过 {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
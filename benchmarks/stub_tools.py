@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 基准测试用的桩工具：名称、描述和参数与真实插件一致（取自插件清单），
+# 实现只等待固定延迟并返回固定大小的结果，不访问外部网络
+
+import asyncio
+import json
+from mcp.registry import MANIFEST_PATH, build_manifest
+
+
+def _manifest_tools():
+    manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8")) if MANIFEST_PATH.exists() else build_manifest()
+    return [tool for plugin in manifest["plugins"].values() for tool in plugin["tools"]]
+
+
+def make_stub(name, latency=0.05, payload_size=200):
+    async def stub(arguments):
+        await asyncio.sleep(latency)
+        return {
+            "tool": name,
+            "arguments": {k: v for k, v in arguments.items() if not k.startswith("__")},
+            "payload": "x" * payload_size
+        }
+    stub.__name__ = name
+    return stub
+
+
+def register_stub_tools(mcp, latency=0.05, payload_size=200, cache=False):
+    """
+    注册（或覆盖）与真实插件同名的桩工具
+    cache=False 时不声明 cache_ttl，每次调用都实际执行，便于测量管线本身
+    """
+    for tool in _manifest_tools():
+        options = dict(tool["options"]) if cache else {}
+        mcp.register_tool_function(
+            name=tool["name"],
+            description=tool["description"],
+            parameters=tool["parameters"],
+            func=make_stub(tool["name"], latency, payload_size),
+            **options
+        )
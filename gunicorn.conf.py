@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 生产模式启动配置：gunicorn -c gunicorn.conf.py api_server:app
+# - 主进程先导入 api_server（preload_app）：加载配置、工具清单、插件代码、工具 schema 和分词器，之后 fork 出各 worker 共享
+# - 每个 worker 启动时丢弃继承的连接和线程池（post_fork），建立到模型服务的连接后 /ready 才返回 200
+# - 收到 SIGTERM 后 worker 先进入 draining（/ready 返回 503），MCP_DRAIN_SECONDS 秒后停止接收新连接，
+#   等待进行中的请求完成，超过 graceful_timeout 仍未完成时强制退出（MCP_DRAIN_SECONDS 应小于 graceful_timeout）
+# 环境变量：WEB_CONCURRENCY（worker 数，默认为可用 CPU 核数）、PORT、MCP_DRAIN_SECONDS
+
+import os
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))  # 容器限制了可用 CPU 时按实际可用核数
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+os.environ.setdefault("MCP_PRELOAD", "1")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", _cpu_count()))
+worker_class = "uvicorn_worker.UvicornWorker"  # uvicorn-worker 包（uvicorn.workers 已弃用）
+preload_app = True
+timeout = 120  # worker 无响应多久后被重启（秒），需大于最慢的一次工具调用
+graceful_timeout = 30
+keepalive = 5
+
+
+def post_fork(server, worker):
+    import api_server
+
+    api_server.mcp.after_fork()
@@ -4,7 +4,7 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from mcp.context import MCPContext
-from mcp.registry import register_all_plugins
+from mcp.registry import register_all_tools
 
 
 # ==== 配置你的 OpenAI Key 和 Base URL（可接 deepseek） ====
@@ -16,18 +16,18 @@ def setup_mcp():
     mcp = MCPContext(api_key=OPENAI_API_KEY, base_url=BASE_URL)
 
     # 注册工具函数（plugin）
-    register_all_plugins(mcp)
+    register_all_tools(mcp)
 
     # 注册记忆模块
     mcp.register_module(
         "memory",
         lambda: "\n".join(mcp.memory.get_recent(5)),
         priority=2,
-        description="记录用户最近的说话内容"
+        description="记录用户最近的说话内容",
+        version_fn=mcp.memory.version
     )
 
-    # 注册记忆更新 Hook
-    mcp.register_hook(lambda user_input, modules: mcp.memory.add(f"用户说过：{user_input}"))
+    # build_prompt 已把每次输入写入记忆，这里不再注册重复写入的 Hook
 
     return mcp
 
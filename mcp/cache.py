@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 工具结果缓存
+# - LRUCache: 进程内 TTL + LRU 缓存，按条目数上限淘汰
+# - SqliteCache: 可选的共享后端，多个 uvicorn worker 共用一份缓存
+# - ToolCache: 包装工具函数，按工具声明的 TTL 缓存结果，并统计命中/未命中
+
+import asyncio
+import functools
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import yaml
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+
+def make_cache_key(name, arguments):
+    """工具名 + 规范化参数；以 __ 开头的注入参数（如 __api_keys__）不参与计算"""
+    args = {k: v for k, v in (arguments or {}).items() if not k.startswith("__")}
+    return f"{name}:{json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)}"
+
+
+class LRUCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        expires_at = expires_at or time.time() + ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteCache:
+    """
+    基于 sqlite 的共享缓存（WAL 模式），值以 JSON 保存
+    超过 max_entries 时按最近访问时间淘汰
+    """
+
+    def __init__(self, path="cache/tool_cache.sqlite3", max_entries=10000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)"
+            )
+
+    def _conn(self):
+        # sqlite 连接不能跨线程共享，每个线程各持一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self):
+        """丢弃从父进程继承的 sqlite 连接（pre-fork 模式下 worker 启动时调用），之后按需重新打开"""
+        self._local = threading.local()
+
+    def get(self, key):
+        """返回 (是否命中, 值, 过期时间)"""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return False, None, None
+        with conn:
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return True, json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), now + ttl, now)
+            )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def prune(self):
+        """清理过期条目，并把条目数压回上限以内"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache")
+
+
+class ToolCache:
+    """
+    工具结果缓存：先查进程内 LRU，再查共享后端（如果配置了）
+    只缓存成功结果（不含 "error" 字段、也不是 stale 的返回值）
+    """
+
+    def __init__(self, local=None, shared=None):
+        self.local = local or LRUCache()
+        self.shared = shared
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_path="configs/cache.yaml"):
+        path = Path(config_path)
+        config = yaml.safe_load(path.open()) if path.exists() else {}
+        config = config or {}
+        local = LRUCache(max_entries=config.get("max_entries", 1024))
+        shared = None
+        if config.get("backend") == "sqlite":
+            shared = SqliteCache(
+                path=config.get("sqlite_path", "cache/tool_cache.sqlite3"),
+                max_entries=config.get("sqlite_max_entries", 10000)
+            )
+        return cls(local=local, shared=shared)
+
+    def get(self, key):
+        hit, value = self.local.get(key)
+        if hit:
+            return True, value
+        if self.shared is not None:
+            hit, value, expires_at = self.shared.get(key)
+            if hit:
+                self.local.set(key, value, expires_at=expires_at)
+                return True, value
+        return False, None
+
+    def set(self, key, value, ttl):
+        self.local.set(key, value, ttl=ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    async def aget(self, key):
+        """get 的异步版本：进程内 LRU 未命中时在线程中查询共享后端，不阻塞事件循环"""
+        hit, value = self.local.get(key)
+        if hit or self.shared is None:
+            return hit, value
+        hit, value, expires_at = await asyncio.to_thread(self.shared.get, key)
+        if hit:
+            self.local.set(key, value, expires_at=expires_at)
+        return hit, value
+
+    async def aset(self, key, value, ttl):
+        self.local.set(key, value, ttl=ttl)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, value, ttl)
+
+    def _count(self, name, hit):
+        with self._lock:
+            self.counters[name]["hits" if hit else "misses"] += 1
+
+    @staticmethod
+    def _cacheable(result):
+        # 错误结果和限流/熔断时返回的过期结果（stale）都不缓存
+        return not (isinstance(result, dict) and ("error" in result or result.get("stale")))
+
+    def wrap(self, name, func, ttl):
+        """
+        返回带缓存的工具函数（保持原函数的同步/异步形态）；ttl 为空或 func 为空时原样返回
+        """
+        if not ttl or func is None:
+            return func
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def cached(arguments):
+                key = make_cache_key(name, arguments)
+                hit, value = await self.aget(key)
+                self._count(name, hit)
+                if hit:
+                    return value
+                result = await func(arguments)
+                if self._cacheable(result):
+                    await self.aset(key, result, ttl)
+                return result
+        else:
+            @functools.wraps(func)
+            def cached(arguments):
+                key = make_cache_key(name, arguments)
+                hit, value = self.get(key)
+                self._count(name, hit)
+                if hit:
+                    return value
+                result = func(arguments)
+                if self._cacheable(result):
+                    self.set(key, result, ttl)
+                return result
+
+        return cached
+
+    def stats(self):
+        hits = sum(c["hits"] for c in self.counters.values())
+        misses = sum(c["misses"] for c in self.counters.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "local_entries": len(self.local),
+            "tools": {name: dict(c) for name, c in self.counters.items()}
+        }
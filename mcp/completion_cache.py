@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 模型调用结果缓存（配置见 configs/cache.yaml 的 completions 部分）
+# 规划阶段（intent_decision / tool_decision / planner）的请求经常完全相同（前端重复提问、重试、批量重跑），
+# 以 模型 + messages + tools + 采样参数 的哈希为键，把响应保存在 sqlite 中：
+# - WAL 模式，多个 uvicorn worker 共用同一个文件
+# - 总大小超过 max_bytes 时按最近访问时间淘汰
+# - 每次请求可选择 use（默认）/ bypass（不读不写）/ refresh（不读，写入新结果）
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import yaml
+from pathlib import Path
+
+MODES = ("use", "bypass", "refresh")
+
+
+def completion_key(kwargs):
+    """请求参数 -> 内容哈希；stream 等不影响结果的参数不参与计算"""
+    payload = {k: v for k, v in kwargs.items() if k not in ("stream", "stream_options", "timeout")}
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, path="cache/completions.sqlite3", max_bytes=256 * 1024 * 1024, ttl=86400,
+                 tasks=("intent_decision", "tool_decision", "planner")):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.tasks = set(tasks)
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+
+    @classmethod
+    def from_config(cls, config_path="configs/cache.yaml"):
+        """未启用时返回 None"""
+        path = Path(config_path)
+        config = yaml.safe_load(path.open()) if path.exists() else {}
+        config = (config or {}).get("completions") or {}
+        if not config.get("enabled"):
+            return None
+        return cls(
+            path=config.get("sqlite_path", "cache/completions.sqlite3"),
+            max_bytes=config.get("max_bytes", 256 * 1024 * 1024),
+            ttl=config.get("ttl", 86400),
+            tasks=config.get("tasks", ("intent_decision", "tool_decision", "planner"))
+        )
+
+    def _conn(self):
+        # sqlite 连接不能跨线程共享，每个线程各持一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self):
+        """丢弃从父进程继承的 sqlite 连接（pre-fork 模式下 worker 启动时调用），之后按需重新打开"""
+        self._local = threading.local()
+
+    def get(self, key):
+        """返回缓存的响应（dict），未命中或已过期时返回 None"""
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM completions WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        text = json.dumps(value, ensure_ascii=False, default=str)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, text, len(text.encode("utf-8")), now, now)
+            )
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self.prune()
+
+    def prune(self):
+        """删除过期条目，并按最近访问时间淘汰，直到总大小不超过 max_bytes"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM completions WHERE created_at <= ?", (time.time() - self.ttl,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            freed = 0
+            keys = []
+            for key, size in conn.execute("SELECT key, size FROM completions ORDER BY accessed_at"):
+                keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM completions WHERE key = ?", keys)
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM completions")
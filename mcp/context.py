@@ -9,35 +9,79 @@
 # 1. 注册模块和工具函数
 # 2. 处理用户输入和工具调用
 # 3. 构建和生成最终的上下文内容
-# 4. 估算 token 数量
+# 4. 计算 token 数量（按模型选择分词器，见 mcp/tokenizer.py）
 # 5. 处理模块的优先级和依赖关系
 # 6. 处理函数调用的响应
 # 7. 生成最终的上下文内容
+# 8. 提供异步管线 abuild_prompt（同步接口 build_prompt 为其包装）
+# 9. 每次请求使用独立的 MCPSession，共享部分只读，请求之间互不干扰
+# 10. 记录各阶段耗时、工具调用和模型 token 用量（见 mcp/metrics.py）
 
 # mcp/context.py
 
-from openai import OpenAI
+from openai import APIStatusError, OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion
 from mcp.model_router import ModelRouter
 from mcp.memory import MemoryStore
+from mcp.executor import ToolExecutor
+from mcp.cache import ToolCache, make_cache_key
+from mcp.completion_cache import MODES as LLM_CACHE_MODES, CompletionCache, completion_key
+from mcp.singleflight import SingleFlight
+from mcp.resilience import ToolGuard
+from mcp import metrics
+from mcp.http import HttpClient
+from mcp.decision_cache import DecisionCache, module_fingerprint
+from mcp.tokenizer import TokenCounter, estimate_tokens
+from mcp.packer import pack_modules
+from mcp.tool_schema import ToolSchema
+from mcp.encoders import ENCODERS, encode
+from mcp.tool_retriever import ToolRetriever
+from mcp.tool_results import ToolResultStore
+from mcp.session import MCPSession, current_session, module_entry
+import asyncio
+import contextlib
+import threading
+import time
 import json
+import weakref
+from types import SimpleNamespace
 import yaml
 from pathlib import Path
 
-def estimate_tokens(text: str) -> int:
-    return len(text) // 4  # 简化估算
+def _public_arguments(arguments):
+    """去掉框架注入的 __ 开头参数（api_keys、HTTP 客户端等），用于日志和事件输出"""
+    return {k: v for k, v in arguments.items() if not k.startswith("__")}
+
+def _string_list(value):
+    """模型返回的模块名数组：只保留字符串项；不是数组时返回 None"""
+    if not isinstance(value, list):
+        return None
+    return [item for item in value if isinstance(item, str)]
 
 class MCPContext:
     def __init__(self, api_key, base_url, max_token_limit=1500):
         self.modules = {}
+        self._tools_version = 0
+        self._tool_schema = None
         self.update_hooks = []
         self.tools = {}
         self.max_token_limit = max_token_limit
-        self.current_user_input = ""
 
         # 初始化模型客户端和调度器
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self._client_options = {"api_key": api_key, "base_url": base_url}
+        self.client = OpenAI(**self._client_options)
+        self._aclients = weakref.WeakKeyDictionary()  # event loop -> AsyncOpenAI
         self.router = ModelRouter()
-        self.memory = MemoryStore()
+        self.token_counter = TokenCounter(self.router)
+        self.memory = MemoryStore.from_config()
+        self.tool_results = ToolResultStore.from_config()
+        self.metrics = metrics.registry
+        self.executor = ToolExecutor(metrics=self.metrics)
+        self.tool_cache = ToolCache.from_config()
+        self.completion_cache = CompletionCache.from_config()  # 未启用时为 None
+        self.singleflight = SingleFlight()
+        self.guard = ToolGuard.from_config()
+        self.http = HttpClient.from_config()
 
         # ✅ 加载所有 API key 配置
         api_key_path = Path("configs/api_keys.yaml")
@@ -48,82 +92,564 @@ class MCPContext:
             self.api_keys = {}
             print("[WARN] 未找到 configs/api_keys.yaml，api_keys 默认为空")
 
-    def register_module(self, name, content_fn, priority=1, deps=None, description=""):
-        self.modules[name] = {
-            "fn": content_fn,
-            "priority": priority,
-            "deps": deps or [],
-            "description": description
-        }
+        # 模块选择决策缓存（快速路径），配置见 configs/router.yaml 的 planner 路由
+        planner = self.router.get_options("planner")
+        self.decision_cache = DecisionCache(
+            max_entries=planner.get("decision_cache_size", 1024),
+            similarity_threshold=planner.get("decision_similarity", 0.0)
+        )
+
+        # 工具预筛选，配置见 configs/router.yaml 的 tool_retrieval 路由
+        self.tool_retriever = ToolRetriever(
+            shadow_rate=self.router.get_options("tool_retrieval").get("shadow_rate", 0.0)
+        )
+
+        self.metrics.add_collector("mcp_context", self._collect_metrics)
+
+        # 同步接口使用的后台事件循环（延迟创建）
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def aclient(self):
+        """AsyncOpenAI 的连接池绑定事件循环，因此与 HttpClient 一样，每个事件循环各持一个客户端"""
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(**self._client_options)
+            self._aclients[loop] = client
+        return client
+
+    def register_module(self, name, content_fn, priority=1, deps=None, description="", overflow=None,
+                        ttl=None, version_fn=None, encoder=None):
+        """
+        overflow: 模块超出 token 预算时的处理方式（见 mcp/packer.py）
+                  None 表示直接丢弃，"truncate" 表示截断，也可以传入摘要函数 fn(text, max_tokens) -> text
+        version_fn / ttl: 声明后模块内容和格式化文本跨请求缓存，版本变化或过期时才重新计算
+        encoder: 字典内容的序列化格式（json / json_min / table / yaml_lite），为空时按模型选择（见 configs/router.yaml）
+        """
+        previous = self.modules.get(name)
+        if previous is None or previous["description"] != description:
+            # 模块描述集合变化，之前缓存的模块选择决策全部失效
+            self.decision_cache.invalidate()
+        self.modules[name] = module_entry(content_fn, priority, deps, description, overflow, ttl, version_fn,
+                                          encoder)
+
+    def invalidate_module(self, name):
+        """标记模块内容已变化，下次使用时重新计算"""
+        if name in self.modules:
+            self.modules[name].pop("cache", None)
+
+    @property
+    def current_user_input(self):
+        session = current_session()
+        return session.user_input if session else ""
+
+    def new_session(self, user_input, session_id=None, tool_names=None, llm_cache="use"):
+        """创建单次请求的上下文，共享模块表只做浅拷贝"""
+        if llm_cache and llm_cache not in LLM_CACHE_MODES:
+            raise ValueError(f"llm_cache 只能是 {' / '.join(LLM_CACHE_MODES)}，收到：{llm_cache}")
+        return MCPSession(user_input, self.modules, session_id=session_id, tool_names=tool_names,
+                          llm_cache=llm_cache)
 
     def register_hook(self, hook_fn):
         self.update_hooks.append(hook_fn)
 
-    def register_tool_function(self, name, description, parameters, func=None):
+    def register_tool_function(self, name, description, parameters, func=None, cache_ttl=None):
+        """
+        注册工具函数
+        cache_ttl: 结果缓存时间（秒），为空表示不缓存；缓存配置见 configs/cache.yaml
+        并发的相同调用（工具名和参数相同）会合并为一次上游请求，见 mcp/singleflight.py
+        限流与熔断配置见 configs/limits.yaml
+        """
         self.tools[name] = {
             "name": name,
             "description": description,
             "parameters": parameters,
-            "func": func
+            # 先查缓存，未命中时再合并进行中的相同调用，最后经过限流/熔断才请求上游
+            "func": self.singleflight.wrap(
+                name, self.tool_cache.wrap(name, self.guard.wrap(name, func), cache_ttl)
+            ),
+            "cache_ttl": cache_ttl
         }
-        self.register_module(
-            "tools",
-            content_fn=lambda: {
-                "available_functions": [
-                    {
-                        "name": t["name"],
-                        "description": t["description"],
-                        "parameters": t["parameters"]
-                    } for t in self.tools.values()
-                ]
-            },
-            priority=3,
-            description="GPT 可调用的函数列表"
-        )
+        self._tools_changed()
+        if "tools" not in self.modules:
+            self.register_module(
+                "tools",
+                content_fn=lambda: self.tool_schema.available_functions,
+                priority=3,
+                description="GPT 可调用的函数列表",
+                version_fn=lambda: self._tools_version
+            )
 
-    def _format_content(self, name, content):
-        if isinstance(content, dict):
-            return json.dumps({name: content}, indent=2, ensure_ascii=False)
-        else:
-            return f"[{name.upper()}]\n{content}"
+    def unregister_tool_function(self, name):
+        if self.tools.pop(name, None) is not None:
+            self._tools_changed()
+
+    def _tools_changed(self):
+        # 工具表变化：版本号递增，预编译的 schema 在下次使用时重建
+        self._tools_version += 1
+        self._tool_schema = None
+
+    @property
+    def tool_schema(self):
+        """预编译的工具 schema（见 mcp/tool_schema.py），只在工具增删后重建"""
+        schema = self._tool_schema
+        if schema is None or schema.version != self._tools_version:
+            schema = ToolSchema(self.tools, version=self._tools_version)
+            self._tool_schema = schema
+        return schema
+
+    def _module_slot(self, name, data, session=None):
+        """
+        返回模块的缓存槽 {content, texts, tokens}，只在内容可能变化时重新计算：
+        - 声明了 version_fn / ttl 的模块跨请求缓存在模块项上，版本变化或过期时重算
+        - 其余模块在同一次请求内只计算一次（记录在 session.evaluated）
+        """
+        version_fn, ttl = data.get("version_fn"), data.get("ttl")
+        if version_fn is None and ttl is None:
+            slot = session.evaluated.get(name) if session else None
+            if slot is None:
+                content = data["fn"]()
+                slot = {"content": content, "texts": {}, "tokens": {}}
+                if session:
+                    session.evaluated[name] = slot
+            return slot
+
+        version = version_fn() if version_fn else None
+        now = time.time()
+        slot = data.get("cache")
+        if slot is None or slot["version"] != version or (slot["expires_at"] and slot["expires_at"] <= now):
+            content = data["fn"]()
+            slot = {
+                "content": content,
+                "texts": {},  # 序列化格式 -> 文本
+                "tokens": {},  # (序列化格式, 模型) -> token 数
+                "version": version,
+                "expires_at": now + ttl if ttl else None
+            }
+            data["cache"] = slot  # 整体替换，并发请求读到的总是完整的槽
+        return slot
+
+    def _evaluate_modules(self, modules, names=None, model=None, session=None):
+        """
+        取得模块内容、格式化文本和 token 数（按格式化后的文本计数，即实际发送给模型的内容）
+        names 为空时取全部模块
+        """
+        module_data = []
+        for name, data in modules.items():
+            if names is not None and name not in names:
+                continue
+            slot = self._module_slot(name, data, session)
+            encoder = self._encoder_for(data, model)
+            text = slot["texts"].get(encoder)
+            if text is None:
+                text = slot["texts"][encoder] = encode(encoder, name, slot["content"])
+            tokens = slot["tokens"].get((encoder, model))
+            if tokens is None:
+                tokens = slot["tokens"][(encoder, model)] = self.token_counter.count(text, model)
+            module_data.append({
+                "name": name,
+                "priority": data["priority"],
+                "tokens": tokens,
+                "deps": data["deps"],
+                "content": slot["content"],
+                "text": text,
+                "overflow": data.get("overflow")
+            })
+        return module_data
+
+    def _encoder_for(self, data, model=None):
+        """模块声明的格式优先，其次是模型的配置（configs/router.yaml 的 context_encoding），默认 json"""
+        options = self.router.get_options("context_encoding")
+        encoder = data.get("encoder") or (options.get("models") or {}).get(model) or options.get("default", "json")
+        return encoder if encoder in ENCODERS else "json"
+
+    def _collect_metrics(self):
+        """各缓存、合并和熔断组件自己维护的计数器，在输出 /metrics 时读取"""
+        cache = [
+            ({"tool": t, "result": result}, c[key])
+            for t, c in self.tool_cache.counters.items()
+            for result, key in (("hit", "hits"), ("miss", "misses"))
+        ]
+        coalesced = [({"tool": t}, c["shared"]) for t, c in self.singleflight.counters.items()]
+        guard = self.guard.stats()
+        rejected = [({"tool": t, "reason": r}, s[r]) for t, s in guard.items() for r in ("rate_limited", "circuit_open")]
+        decision = self.decision_cache.stats()
+        retrieval = self.tool_retriever.stats()
+        return [
+            ("mcp_tool_cache_total", "counter", "工具结果缓存命中/未命中次数", cache),
+            ("mcp_tool_coalesced_total", "counter", "合并到进行中相同调用的次数", coalesced),
+            ("mcp_tool_rejected_total", "counter", "被限流或熔断拒绝的工具调用次数", rejected),
+            ("mcp_tool_stale_served_total", "counter", "限流或熔断时返回过期结果的次数",
+             [({"tool": t}, s["stale_served"]) for t, s in guard.items()]),
+            ("mcp_circuit_open", "gauge", "工具熔断器状态（1 表示熔断中）",
+             [({"tool": t}, int(s["state"] != "closed")) for t, s in guard.items()]),
+            ("mcp_decision_cache_total", "counter", "模块选择决策缓存命中/未命中次数", [
+                ({"result": "hit"}, decision["hits"]),
+                ({"result": "similar_hit"}, decision["similar_hits"]),
+                ({"result": "miss"}, decision["misses"])
+            ]),
+            ("mcp_tool_retrieval_shadow_total", "counter", "工具预筛选影子评估次数",
+             [({}, retrieval["shadow_requests"])]),
+            ("mcp_tool_retrieval_shadow_recall", "gauge", "影子评估中 top_k 覆盖模型实际调用工具的比例",
+             [({}, retrieval["shadow_recall"])] if retrieval["shadow_recall"] is not None else [])
+        ]
+
+    def _record_usage(self, model, usage):
+        if usage is None:
+            return
+        self.metrics.inc("mcp_llm_tokens_total", {"model": model, "type": "prompt"}, usage.prompt_tokens or 0)
+        self.metrics.inc("mcp_llm_tokens_total", {"model": model, "type": "completion"}, usage.completion_tokens or 0)
 
-    def update_context(self, user_input):
+    async def _acomplete(self, task, session=None, **kwargs):
+        """
+        调用模型（非流式），记录耗时和 token 用量；task 为路由名，用作指标标签
+        task 在 completion 缓存范围内时先查缓存，session.llm_cache 控制是否读写缓存
+        sqlite 读写（多个 worker 共用文件时可能等待写锁）放到线程中执行，不阻塞事件循环
+        """
+        cache = self.completion_cache
+        mode = session.llm_cache if session is not None else "use"
+        key = None
+        if cache is not None and task in cache.tasks and mode != "bypass":
+            key = completion_key(kwargs)
+            cached = await asyncio.to_thread(cache.get, key) if mode == "use" else None
+            self.metrics.inc("mcp_llm_cache_total", {"task": task, "result": "hit" if cached else "miss"})
+            if cached is not None:
+                return ChatCompletion(**cached)
+
+        with self.metrics.timer("mcp_llm_seconds", task=task, model=kwargs["model"]):
+            response = await self.aclient.chat.completions.create(**kwargs)
+        self._record_usage(kwargs["model"], getattr(response, "usage", None))
+        if key is not None and hasattr(response, "model_dump"):
+            await asyncio.to_thread(cache.set, key, response.model_dump())
+        return response
+
+    def warmup(self):
+        """
+        预先加载所有请求共享的只读状态：工具 schema 与检索索引、各路由模型的分词器、跨请求缓存的模块
+        pre-fork 模式下在主进程中调用，fork 出的 worker 直接继承，不必在首个请求时再加载
+        """
+        self.tool_retriever.ensure_index(self.tool_schema)
+        models = {self.router.get_model_for(task) for task in ("intent_decision", "tool_decision", "final_response", "planner")}
+        for model in models:
+            self.token_counter.tokenizer_for(model)
+        cached = [name for name, data in self.modules.items() if data.get("version_fn") or data.get("ttl")]
+        for model in models:
+            try:
+                self._evaluate_modules(self.modules, names=cached, model=model)
+            except Exception as e:
+                print(f"[WARN] 预热模块失败：{e}")
+
+    def after_fork(self):
+        """
+        pre-fork 模式下在每个 worker 启动时调用：丢弃从主进程继承的连接、线程池和事件循环，之后按需重新创建
+        """
+        self.client = OpenAI(**self._client_options)
+        self._aclients = weakref.WeakKeyDictionary()
+        self.http = HttpClient.from_config()
+        self.executor = ToolExecutor(metrics=self.metrics)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        for store in (self.memory, self.tool_cache.shared, self.completion_cache):
+            if store is not None:
+                store.reset_connections()
+
+    async def awarmup(self):
+        """
+        建立到模型服务的 keep-alive 连接（请求一次模型列表）
+        服务返回错误状态码也说明连接已建立；连接失败时抛出异常，由调用方重试
+        """
+        try:
+            await self.aclient.models.list()
+        except APIStatusError:
+            pass
+
+    def update_context(self, user_input, modules=None):
         for hook in self.update_hooks:
-            hook(user_input, self.modules)
+            hook(user_input, self.modules if modules is None else modules)
 
-    def handle_tool_call(self, tool_call_obj):
-        name = tool_call_obj.name
-        arguments = tool_call_obj.arguments or {}
-        if isinstance(arguments, str):
-            arguments = json.loads(arguments)
+    def _run_sync(self, coro):
+        """
+        在后台事件循环中执行协程，供同步接口复用异步实现。
+        始终复用同一个循环，避免 AsyncOpenAI / httpx 的连接池跨循环失效。
+        """
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="mcp-loop", daemon=True).start()
+                    self._loop = loop
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
 
-        tool = self.tools.get(name)
-        if tool and tool.get("func"):
-            # ✅ 将 api_keys 注入到参数中（方便插件使用）
-            arguments["__api_keys__"] = self.api_keys
+    async def ahandle_tool_calls(self, tool_call_objs, session=None):
+        """
+        并发执行同一轮中的多个工具调用，并按 tool_calls 原始顺序把结果注册到本次请求的会话中
+        没有会话时（脚本直接调用）与原来一样注册到共享模块表，之后的 generate_context() 可以取到
+        会话限定了 tool_names 时，不在其中的调用被跳过
+        返回与 tool_call_objs 中可执行调用同序的结果列表
+        """
+        session = session or current_session()
+        allowed = None if session is None or session.tool_names is None else set(session.tool_names)
+        calls = []
+        for tool_call_obj in tool_call_objs:
+            name = tool_call_obj.name
+            if allowed is not None and name not in allowed:
+                # 本次请求限定了工具：模型（或规划结果）给出的其他工具调用一律不执行
+                print(f"[WARN] 工具 {name} 不在本次请求允许的工具中，已跳过")
+                continue
+            arguments = tool_call_obj.arguments or {}
+            if isinstance(arguments, str):
+                arguments = json.loads(arguments)
 
-            result = tool["func"](arguments)
-            print(f"[TOOL] 执行函数：{name}，参数：{arguments}")
-            self.register_module(
+            tool = self.tools.get(name)
+            if tool and tool.get("func"):
+                # ✅ 将 api_keys 和共享 HTTP 客户端注入到参数中（方便插件使用）
+                arguments["__api_keys__"] = self.api_keys
+                arguments["__http__"] = self.http
+                arguments["__guard__"] = self.guard
+                func = tool["func"]
+                if session is not None and session.tool_memo is not None:
+                    func = self._memoized(session.tool_memo, name, func)
+                calls.append((name, func, arguments))
+
+        if session is not None:
+            for name, _, arguments in calls:
+                session.emit("tool_start", {"name": name, "arguments": _public_arguments(arguments)})
+
+        def on_result(index, name, result):
+            if session is not None:
+                session.emit("tool_end", {"name": name, "result": result})
+
+        results = await self.executor.run(calls, on_result=on_result)
+        target = session if session is not None else self
+        for (name, _, arguments), result in zip(calls, results):
+            print(f"[TOOL] 执行函数：{name}，参数：{_public_arguments(arguments)}")
+            # 压缩后再放入上下文（去掉 raw 等大字段），并保存供该会话之后几轮使用
+            content = self.tool_results.compact(result)
+            if session is not None and session.turn:
+                self.tool_results.put(session.session_id, session.turn, name, content)
+            target.register_module(
                 f"tool_result_{name}",
-                content_fn=lambda result=result: result,
+                content_fn=lambda content=content: content,
                 priority=4,
-                description=f"函数 {name} 的调用结果"
+                description=f"函数 {name} 的调用结果",
+                overflow="truncate",
+                version_fn=lambda: 0  # 调用结果不会再变化，只需计算一次
+            )
+        return results
+
+    def _memoized(self, memo, name, func):
+        """批量请求内相同的工具调用（工具名和参数相同）只执行一次，其余调用共享结果"""
+        async def call(arguments):
+            key = make_cache_key(name, arguments)
+            task = memo.get(key)
+            if task is None:
+                task = memo[key] = asyncio.ensure_future(self.executor.call(func, arguments))
+            # shield：某个请求超时被取消时不影响其他共享该调用的请求
+            return await asyncio.shield(task)
+        return call
+
+    async def ahandle_tool_call(self, tool_call_obj, session=None):
+        results = await self.ahandle_tool_calls([tool_call_obj], session=session)
+        return results[0] if results else None
+
+    def handle_tool_call(self, tool_call_obj, session=None):
+        """
+        同步接口：结果注册到 session（未传时取调用方线程的当前会话）；都没有时注册到共享模块表，
+        与原来一样之后的 generate_context() 会包含该结果
+        """
+        # 当前会话要在调用方线程中取：协程在后台事件循环中执行，看不到调用方的 contextvar
+        session = session or current_session()
+        return self._run_sync(self.ahandle_tool_call(tool_call_obj, session=session))
+
+    async def abuild_prompt(self, user_input, session_id="default", tool_names=None, llm_cache="use"):
+        """
+        异步构建 prompt
+        session_id 用于划分记忆；传 None 表示一次性会话，请求结束后丢弃其记忆
+        tool_names 可限定本次请求发给模型的工具（只发送这些工具的 schema），为空表示全部
+        llm_cache 控制规划阶段模型调用缓存：use（默认）/ bypass（不读不写）/ refresh（重新调用并覆盖缓存）
+        """
+        session = self.new_session(user_input, session_id=session_id, tool_names=tool_names, llm_cache=llm_cache)
+        with self._activated(session):
+            return await self._abuild_prompt(session)
+
+    async def abuild_prompts(self, inputs, concurrency=8, tool_names=None, llm_cache="use"):
+        """
+        批量构建 prompt，最多 concurrency 个同时进行，按完成顺序产出 (序号, prompt, 错误信息)
+        - 相同的输入只构建一次，结果产出给每个序号
+        - 整批共用工具调用记录，相同的工具调用只执行一次
+        每个输入使用一次性会话，不读写会话记忆
+        """
+        groups = {}  # 输入 -> [序号]
+        for index, user_input in enumerate(inputs):
+            groups.setdefault(user_input, []).append(index)
+
+        memo = {}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(user_input):
+            async with semaphore:
+                session = self.new_session(user_input, session_id=None, tool_names=tool_names, llm_cache=llm_cache)
+                session.tool_memo = memo
+                try:
+                    with self._activated(session):
+                        return user_input, await self._abuild_prompt(session), None
+                except Exception as e:
+                    return user_input, None, str(e)
+
+        tasks = [asyncio.ensure_future(run(user_input)) for user_input in groups]
+        try:
+            for future in asyncio.as_completed(tasks):
+                user_input, prompt, error = await future
+                for index in groups[user_input]:
+                    yield index, prompt, error
+        finally:
+            # 调用方提前停止迭代（如客户端断开）时取消剩余的请求
+            for task in tasks:
+                task.cancel()
+
+    def build_prompts(self, inputs, concurrency=8, tool_names=None, llm_cache="use"):
+        """同步接口：批量构建 prompt，返回与 inputs 同序的 prompt 列表（失败的为 None）"""
+        async def collect():
+            results = [None] * len(inputs)
+            async for index, prompt, _ in self.abuild_prompts(inputs, concurrency, tool_names, llm_cache):
+                results[index] = prompt
+            return results
+        return self._run_sync(collect())
+
+    async def astream_prompt(self, user_input, session_id="default", answer=True, tool_names=None, llm_cache="use"):
+        """
+        流式执行管线，按发生顺序产出 (event, data)：
+        modules → tool_start / tool_end → context → token（answer=True 时逐段输出 final_response 模型的回答）→ done
+        出错时产出 error 事件后结束
+        """
+        session = self.new_session(user_input, session_id=session_id, tool_names=tool_names, llm_cache=llm_cache)
+        session.events = asyncio.Queue()
+
+        async def run():
+            try:
+                with self._activated(session):
+                    prompt = await self._abuild_prompt(session)
+                    session.emit("context", {"prompt": prompt})
+                    if answer:
+                        async for text in self._astream_answer(prompt):
+                            session.emit("token", {"text": text})
+                session.emit("done", {})
+            except Exception as e:
+                session.emit("error", {"message": str(e)})
+            finally:
+                session.events.put_nowait(None)
+
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                item = await session.events.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            # 客户端断开时停止后续的模型和工具调用
+            if not task.done():
+                task.cancel()
+
+    async def _astream_answer(self, prompt):
+        model = self.router.get_model_for("final_response")
+        stream = await self.aclient.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True}  # 最后一个分片带上 token 用量
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            self._record_usage(model, getattr(chunk, "usage", None))
+
+    @contextlib.contextmanager
+    def _activated(self, session):
+        token = session.activate()
+        try:
+            yield session
+        finally:
+            session.deactivate(token)
+            if session.ephemeral:
+                # 一次性会话的记忆从未写入磁盘，只需清理内存
+                self.memory.discard(session.session_id, from_disk=False)
+
+    def _restore_tool_results(self, session):
+        """把该会话之前几轮仍在生命周期内的工具结果注册为本次请求的模块（优先级低于本轮结果）"""
+        if session.ephemeral:
+            return
+        session.turn = self.tool_results.begin_turn(session.session_id)
+        for name, content in self.tool_results.active(session.session_id, session.turn):
+            session.register_module(
+                f"tool_result_{name}",
+                content_fn=lambda content=content: content,
+                priority=3,
+                description=f"函数 {name} 之前的调用结果",
+                overflow="truncate",
+                version_fn=lambda: 0
             )
 
-    def build_prompt(self, user_input):
-        self.current_user_input = user_input
-        self.memory.add(f"用户说过：{user_input}")
-        self.update_context(user_input)
+    def _preselect_tools(self, session):
+        """
+        按相关度预筛选发给模型的工具（只在请求未指定 tool_names、且工具数超过 min_tools 时生效）
+        返回影子评估时预测的 top-k 工具名，否则返回 None
+        """
+        options = self.router.get_options("tool_retrieval")
+        k = options.get("top_k", 0)
+        if session.tool_names is not None or not k or len(self.tools) <= options.get("min_tools", k):
+            return None
+
+        self.tool_retriever.ensure_index(self.tool_schema)
+        predicted = self.tool_retriever.top_k(session.user_input, k)
+        if self.tool_retriever.should_shadow():
+            # 影子评估：本次仍发送全部工具，事后统计 top-k 是否覆盖模型实际调用的工具
+            return predicted
+        session.tool_names = predicted
+        return None
 
-        # === STEP 1: 模块调度 ===
-        module_descriptions = {k: v["description"] for k, v in self.modules.items()}
+    def _scope_tools_module(self, session):
+        """本次请求限定了工具（tool_names 或预筛选）时，tools 模块也只列出这些工具，使 prompt 不随工具总数增长"""
+        entry = session.modules.get("tools")
+        if session.tool_names is None or entry is None:
+            return
+        names = frozenset(session.tool_names)
+        session.register_module(
+            "tools",
+            content_fn=lambda: self.tool_schema.available(names),
+            priority=entry["priority"],
+            deps=entry["deps"],
+            description=entry["description"],
+            overflow=entry["overflow"],
+            encoder=entry["encoder"]
+        )
+
+    async def _aselect_modules(self, session, planner):
+        """
+        STEP 1：选择要激活的模块
+        快速路径：模块数不超过 fast_path_max_modules，或命中之前的决策时，不再调用模型
+        llm_cache 为 bypass / refresh 时不读决策缓存（refresh 仍写入新结果），与 completion 缓存的语义一致
+        """
+        module_names = list(session.modules.keys())
+        if len(module_names) <= planner.get("fast_path_max_modules", 0):
+            return module_names
+
+        fingerprint = module_fingerprint(session.modules)
+        cached = self.decision_cache.get(session.user_input, fingerprint) if session.llm_cache == "use" else None
+        if cached is not None:
+            return cached
+
+        module_descriptions = {k: v["description"] for k, v in session.modules.items()}
         system_prompt = "你是模块调度器，请根据用户输入和模块描述返回要激活的模块名数组（JSON）"
         modules_text = "\n".join([f"- {k}: {v}" for k, v in module_descriptions.items()])
-        user_prompt = f"输入：{user_input}\n模块描述：\n{modules_text}"
+        user_prompt = f"输入：{session.user_input}\n模块描述：\n{modules_text}"
 
         model = self.router.get_model_for("intent_decision")
-        response = self.client.chat.completions.create(
+        response = await self._acomplete(
+            "intent_decision",
+            session,
             model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -134,77 +660,155 @@ class MCPContext:
         content = response.choices[0].message.content.strip()
 
         try:
-            active_module_names = json.loads(content)
+            active_module_names = _string_list(json.loads(content))
         except:
-            active_module_names = list(self.modules.keys())
+            return module_names
+        if active_module_names is None:
+            return module_names
 
-        module_data = []
-        for name, data in self.modules.items():
-            if name in active_module_names:
-                content = data["fn"]()
-                tokens = estimate_tokens(str(content))
-                module_data.append({
-                    "name": name,
-                    "priority": data["priority"],
-                    "tokens": tokens,
-                    "deps": data["deps"],
-                    "content": content
-                })
-
-        context_text = "\n\n".join(self._format_content(m["name"], m["content"]) for m in module_data)
-        full_prompt = f"{context_text}\n\n[USER]\n{user_input}"
-
-        # === STEP 2: 函数调用判断 ===
+        if session.llm_cache != "bypass":
+            self.decision_cache.set(session.user_input, fingerprint, active_module_names)
+        return active_module_names
+
+    async def _adecide_tools(self, session, active_module_names):
+        """
+        STEP 2：带上已激活模块的内容，让模型判断需要调用哪些工具
+        tool_names 没有匹配到任何已注册工具时不调用模型（tools=[] 会被 API 拒绝，也不可能产生工具调用）
+        """
+        tools = self.tool_schema.subset(session.tool_names)[0]
+        if not tools:
+            return []
         model = self.router.get_model_for("tool_decision")
-        response = self.client.chat.completions.create(
+        # tools=[...] 不在上下文模块里，单独记录它占用的 prompt token，便于和 mcp_llm_tokens_total 对照
+        schema_tokens = self.tool_schema.tokens(self.token_counter, model, session.tool_names)
+        self.metrics.inc("mcp_tool_schema_tokens_total", {"model": model}, schema_tokens)
+        module_data = self._evaluate_modules(session.modules, active_module_names, model, session)
+        context_text = "\n\n".join(m["text"] for m in module_data)
+        full_prompt = f"{context_text}\n\n[USER]\n{session.user_input}"
+
+        response = await self._acomplete(
+            "tool_decision",
+            session,
             model=model,
             messages=[
                 {"role": "system", "content": "你是一个可以调用工具的 AI"},
                 {"role": "user", "content": full_prompt}
             ],
-            tools=[{
-                "type": "function",
-                "function": {
-                    "name": t["name"],
-                    "description": t["description"],
-                    "parameters": {
-                        "type": "object",
-                        "properties": t["parameters"],
-                        "required": list(t["parameters"].keys())
-                    }
-                }
-            } for t in self.tools.values()],
+            tools=tools,
             tool_choice="auto"
         )
 
         choice = response.choices[0]
-        if choice.message.tool_calls:
-            for tool_call in choice.message.tool_calls:
-                self.handle_tool_call(tool_call.function)
+        return [tool_call.function for tool_call in choice.message.tool_calls or []]
 
-        return self.generate_context() + f"\n\n[USER]\n{user_input}"
+    async def _aplan_single_call(self, session):
+        """
+        单次调用规划：一次结构化输出同时给出要激活的模块和要调用的工具，省掉一次模型往返
+        """
+        module_names = list(session.modules.keys())
+        modules_text = "\n".join([f"- {k}: {v['description']}" for k, v in session.modules.items()])
+        model = self.router.get_model_for("planner")
+        context_text = "\n\n".join(
+            m["text"] for m in self._evaluate_modules(session.modules, model=model, session=session)
+            if m["name"] != "tools"
+        )
+        tools_text = self.tool_schema.subset(session.tool_names)[1]
+        system_prompt = (
+            "你是模块调度器和工具调用规划器。请根据用户输入、模块描述和可用工具，返回 JSON 对象："
+            '{"modules": [要激活的模块名], "tool_calls": [{"name": 工具名, "arguments": {参数}}]}，'
+            "不需要调用工具时 tool_calls 为空数组"
+        )
+        user_prompt = (
+            f"输入：{session.user_input}\n模块描述：\n{modules_text}\n"
+            f"可用工具：\n{tools_text}\n\n{context_text}"
+        )
 
-    def generate_context(self):
-        module_data = []
-        for name, data in self.modules.items():
-            content = data["fn"]()
-            tokens = estimate_tokens(str(content))
-            module_data.append({
-                "name": name,
-                "priority": data["priority"],
-                "tokens": tokens,
-                "deps": data["deps"],
-                "content": content
-            })
+        response = await self._acomplete(
+            "planner",
+            session,
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0
+        )
+        content = response.choices[0].message.content.strip()
 
-        module_data.sort(key=lambda x: -x["priority"])
-        selected = set()
-        used_tokens = 0
+        try:
+            plan = json.loads(content)
+        except:
+            return module_names, []
+        if not isinstance(plan, dict):
+            return module_names, []
+
+        calls = plan.get("tool_calls")
+        tool_calls = [
+            SimpleNamespace(
+                name=call.get("name"),
+                arguments=call.get("arguments") if isinstance(call.get("arguments"), dict) else {}
+            )
+            for call in calls if isinstance(call, dict) and isinstance(call.get("name"), str)
+        ] if isinstance(calls, list) else []
+        return _string_list(plan.get("modules")) or module_names, tool_calls
 
-        for m in module_data:
-            if used_tokens + m["tokens"] <= self.max_token_limit:
-                selected.add(m["name"])
-                used_tokens += m["tokens"]
+    async def _abuild_prompt(self, session):
+        with self.metrics.timer("mcp_stage_seconds", stage="build_prompt"):
+            return await self._abuild_prompt_stages(session)
 
-        final_modules = [m for m in module_data if m["name"] in selected]
-        return "\n\n".join(self._format_content(m["name"], m["content"]) for m in final_modules)
+    async def _abuild_prompt_stages(self, session):
+        user_input = session.user_input
+        timer = self.metrics.timer
+
+        with timer("mcp_stage_seconds", stage="update_context"):
+            await self.memory.aadd(f"用户说过：{user_input}", session_id=session.session_id, persist=not session.ephemeral)
+            self.update_context(user_input, session.modules)
+            self._restore_tool_results(session)
+            shadow = self._preselect_tools(session)
+            self._scope_tools_module(session)
+
+        # 规划模式见 configs/router.yaml 的 planner 路由：two_step（默认）| single_call
+        planner = self.router.get_options("planner")
+        if planner.get("mode") == "single_call":
+            with timer("mcp_stage_seconds", stage="plan"):
+                active_module_names, tool_calls = await self._aplan_single_call(session)
+            session.emit("modules", {"modules": active_module_names})
+        else:
+            # === STEP 1: 模块调度 ===
+            with timer("mcp_stage_seconds", stage="intent_decision"):
+                active_module_names = await self._aselect_modules(session, planner)
+            session.emit("modules", {"modules": active_module_names})
+            # === STEP 2: 函数调用判断 ===
+            with timer("mcp_stage_seconds", stage="tool_decision"):
+                tool_calls = await self._adecide_tools(session, active_module_names)
+
+        if shadow is not None:
+            self.tool_retriever.record_shadow(shadow, [tool_call.name for tool_call in tool_calls])
+
+        if tool_calls:
+            with timer("mcp_stage_seconds", stage="tools"):
+                await self.ahandle_tool_calls(tool_calls, session=session)
+
+        with timer("mcp_stage_seconds", stage="generate_context"):
+            context = self.generate_context(session)
+        return context + f"\n\n[USER]\n{user_input}"
+
+    def build_prompt(self, user_input, session_id="default", tool_names=None, llm_cache="use"):
+        """同步接口：abuild_prompt 的包装，供 main.py 等脚本直接调用"""
+        return self._run_sync(self.abuild_prompt(
+            user_input, session_id=session_id, tool_names=tool_names, llm_cache=llm_cache
+        ))
+
+    def generate_context(self, session=None):
+        session = session or current_session()
+        modules = session.modules if session else self.modules
+        # 上下文最终交给 final_response 模型，按其分词器计数
+        model = self.router.get_model_for("final_response")
+        module_data = self._evaluate_modules(modules, model=model, session=session)
+        final_modules = pack_modules(
+            module_data,
+            self.max_token_limit,
+            count_fn=lambda text: self.token_counter.count(text, model)
+        )
+        return "\n\n".join(m["text"] for m in final_modules)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 模块选择（intent_decision）结果缓存
+# 模块选择调用是确定性的（temperature=0），相同输入 + 相同模块描述集合无需重复调用模型
+
+import hashlib
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_input(text: str) -> str:
+    """全角转半角、转小写、合并空白、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = " ".join(text.split())
+    return re.sub(r"[\s?？!！.。,，~～]+$", "", text)
+
+
+def char_ngrams(text: str, n=2):
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def module_fingerprint(modules):
+    """模块描述集合的哈希：模块增删或描述变化都会改变指纹"""
+    descriptions = sorted((name, data.get("description", "")) for name, data in modules.items())
+    return hashlib.sha1(json.dumps(descriptions, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class DecisionCache:
+    """
+    key = (规范化输入, 模块描述指纹)，LRU 淘汰
+    - similarity_threshold: 大于 0 时启用近似查找，精确未命中时复用相似度最高且超过阈值的决策
+    - embed_fn: 可选的本地向量函数 text -> list[float]；不提供时使用字符 n-gram 的 Jaccard 相似度
+    """
+
+    def __init__(self, max_entries=1024, similarity_threshold=0.0, ngram=2, embed_fn=None):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ngram = ngram
+        self.embed_fn = embed_fn
+        self._data = OrderedDict()  # (normalized, fingerprint) -> (features, decision)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _features(self, normalized):
+        if self.embed_fn is not None:
+            return self.embed_fn(normalized)
+        return char_ngrams(normalized, self.ngram)
+
+    def _similarity(self, a, b):
+        if self.embed_fn is not None:
+            return _cosine(a, b)
+        return len(a & b) / len(a | b) if a and b else 0.0
+
+    def get(self, user_input, fingerprint):
+        normalized = normalize_input(user_input)
+        key = (normalized, fingerprint)
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return list(item[1])
+
+        if self.similarity_threshold > 0 and self._data:
+            features = self._features(normalized)
+            best_score, best_key = 0.0, None
+            with self._lock:
+                for (text, fp), (other, _) in self._data.items():
+                    if fp != fingerprint:
+                        continue
+                    score = self._similarity(features, other)
+                    if score > best_score:
+                        best_score, best_key = score, (text, fp)
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    self._data.move_to_end(best_key)
+                    self.similar_hits += 1
+                    return list(self._data[best_key][1])
+
+        self.misses += 1
+        return None
+
+    def set(self, user_input, fingerprint, decision):
+        normalized = normalize_input(user_input)
+        features = self._features(normalized) if self.similarity_threshold > 0 else None
+        with self._lock:
+            self._data[(normalized, fingerprint)] = (features, list(decision))
+            self._data.move_to_end((normalized, fingerprint))
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        """模块描述集合变化时调用，清空全部决策"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 上下文模块的序列化格式（字典内容）；文本内容始终按 [NAME]\n内容 输出
+# - json: 缩进 JSON（原有格式）
+# - json_min: 紧凑 JSON，去掉缩进和多余空格
+# - table: 同构字典列表（如 available_functions）按表格输出，字段名只写一次
+# - yaml_lite: 类 YAML 的缩进格式，字符串不加引号
+# 按模块（register_module 的 encoder 参数）或按模型（configs/router.yaml 的 context_encoding）选择，
+# 各格式的字节数、token 数和耗时对比见 `python -m benchmarks.run --suite encoders`
+
+import json
+
+
+def _json_min(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _scalar(value):
+    """标量：字符串不加引号（空串、多行或首尾有空格时按 JSON 字符串输出），其余按 JSON 输出"""
+    if isinstance(value, str):
+        if not value or "\n" in value or value != value.strip():
+            return _json_min(value)
+        return value
+    return _json_min(value)
+
+
+def _is_scalar(value):
+    return not isinstance(value, (dict, list, tuple))
+
+
+def _homogeneous_rows(value):
+    """至少两行、字段相同的字典列表返回字段名列表，否则返回 None"""
+    if not isinstance(value, (list, tuple)) or len(value) < 2 or not all(isinstance(v, dict) for v in value):
+        return None
+    columns = list(value[0])
+    if not columns or any(list(v) != columns for v in value[1:]):
+        return None
+    return columns
+
+
+def encode_json(name, content):
+    return json.dumps({name: content}, indent=2, ensure_ascii=False, default=str)
+
+
+def encode_json_min(name, content):
+    return _json_min({name: content})
+
+
+def encode_table(name, content):
+    def cell(value):
+        text = _scalar(value) if _is_scalar(value) else _json_min(value)
+        return text.replace("|", "\\|")
+
+    def walk(value, indent):
+        pad = "  " * indent
+        for key, item in value.items():
+            columns = _homogeneous_rows(item)
+            if columns:
+                lines.append(f"{pad}{key}[{len(item)}]{{{'|'.join(columns)}}}:")
+                lines.extend(f"{pad}  " + "|".join(cell(row[c]) for c in columns) for row in item)
+            elif isinstance(item, dict) and item:
+                lines.append(f"{pad}{key}:")
+                walk(item, indent + 1)
+            else:
+                lines.append(f"{pad}{key}: {cell(item)}")
+
+    lines = [f"[{name.upper()}]"]
+    walk(content, 0)
+    return "\n".join(lines)
+
+
+def encode_yaml_lite(name, content):
+    def walk(value, indent):
+        pad = "  " * indent
+        out = []
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if _is_scalar(item) or not item:
+                    out.append(f"{pad}{key}: {_scalar(item) if _is_scalar(item) else _json_min(item)}")
+                else:
+                    out.append(f"{pad}{key}:")
+                    out.extend(walk(item, indent + 1))
+        else:
+            for item in value:
+                if _is_scalar(item) or not item:
+                    out.append(f"{pad}- {_scalar(item) if _is_scalar(item) else _json_min(item)}")
+                else:
+                    nested = walk(item, indent + 1)
+                    out.append(f"{pad}- {nested[0].lstrip()}")
+                    out.extend(nested[1:])
+        return out
+
+    return "\n".join([f"[{name.upper()}]"] + walk(content, 0))
+
+
+ENCODERS = {
+    "json": encode_json,
+    "json_min": encode_json_min,
+    "table": encode_table,
+    "yaml_lite": encode_yaml_lite
+}
+
+
+def register_encoder(name, fn):
+    """注册自定义格式 fn(module_name, content) -> text"""
+    ENCODERS[name] = fn
+
+
+def encode(encoder, name, content):
+    if not isinstance(content, dict):
+        return f"[{name.upper()}]\n{content}"
+    fn = ENCODERS.get(encoder)
+    if fn is None:
+        print(f"[WARN] 未知的上下文格式 {encoder}，改用 json")
+        fn = encode_json
+    return fn(name, content)
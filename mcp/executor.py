@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 工具调用执行引擎：同一轮中的多个 tool_calls 并发执行
+
+import asyncio
+import contextvars
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ToolExecutor:
+    """
+    并发执行同一轮中的多个工具调用
+    - max_concurrency: 单轮内同时执行的调用数上限（同步插件共用同样大小的线程池）
+    - call_timeout: 单次工具调用的超时时间（秒）
+    - turn_deadline: 整轮工具调用的截止时间（秒），到期后未完成的调用被取消
+    - metrics: 可选的 MetricsRegistry，记录每个工具的耗时和结果（ok / error / timeout / cancelled）
+    返回结果与传入的调用顺序一致，便于按序注册
+    """
+
+    def __init__(self, max_concurrency=8, call_timeout=8, turn_deadline=12, metrics=None):
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout
+        self.turn_deadline = turn_deadline
+        self.metrics = metrics
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="mcp-tool")
+
+    async def call(self, func, arguments):
+        # 异步插件直接 await，同步插件放到有界线程池中执行，避免阻塞事件循环
+        # （线程中沿用当前上下文，保证插件看到的是本次请求的会话）
+        if inspect.iscoroutinefunction(func):
+            return await func(arguments)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, contextvars.copy_context().run, func, arguments)
+
+    async def _run_one(self, name, func, arguments, semaphore):
+        async with semaphore:
+            start, status = time.perf_counter(), "ok"
+            try:
+                result = await asyncio.wait_for(self.call(func, arguments), self.call_timeout)
+                if isinstance(result, dict) and "error" in result:
+                    status = "error"
+                return result
+            except asyncio.TimeoutError:
+                status = "timeout"
+                return {"error": f"工具 {name} 调用超时（{self.call_timeout}s）"}
+            except asyncio.CancelledError:
+                # 超出整轮截止时间被取消
+                status = "cancelled"
+                raise
+            except Exception as e:
+                status = "error"
+                return {"error": str(e)}
+            finally:
+                if self.metrics is not None:
+                    self.metrics.observe("mcp_tool_seconds", time.perf_counter() - start, {"tool": name})
+                    self.metrics.inc("mcp_tool_calls_total", {"tool": name, "status": status})
+
+    async def _run_and_report(self, index, name, func, arguments, semaphore, on_result):
+        result = await self._run_one(name, func, arguments, semaphore)
+        if on_result is not None:
+            on_result(index, name, result)
+        return result
+
+    async def run(self, calls, on_result=None):
+        """
+        calls: [(name, func, arguments), ...]
+        on_result: 可选回调 fn(index, name, result)，每个调用结束（或超出截止时间）时按完成顺序触发一次
+        返回与 calls 等长、同序的结果列表
+        """
+        if not calls:
+            return []
+
+        # 信号量按轮创建：asyncio 原语绑定事件循环，不能跨循环复用
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        tasks = [
+            asyncio.ensure_future(self._run_and_report(index, name, func, arguments, semaphore, on_result))
+            for index, (name, func, arguments) in enumerate(calls)
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=self.turn_deadline)
+        for task in pending:
+            task.cancel()
+
+        results = []
+        for index, ((name, _, _), task) in enumerate(zip(calls, tasks)):
+            if task in done:
+                results.append(task.result())
+            else:
+                result = {"error": f"工具 {name} 未在本轮截止时间（{self.turn_deadline}s）内完成"}
+                if on_result is not None:
+                    on_result(index, name, result)
+                results.append(result)
+        return results
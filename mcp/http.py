@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 插件共用的 HTTP 客户端
+# 由框架创建并像 __api_keys__ 一样通过 arguments["__http__"] 注入到插件，
+# 所有工具共用 keep-alive 连接池，避免每次调用都重新握手 TCP/TLS
+# 插件用 check_upstream / error_result 区分上游故障（连接错误、超时、5xx）和其他错误，只有前者计入熔断
+
+import asyncio
+import importlib.util
+import weakref
+import httpx
+import yaml
+from pathlib import Path
+
+RETRY_STATUS = {429, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    - 连接池大小、keep-alive 时长可配置（configs/http.yaml）
+    - 连接错误及 429/5xx 按指数退避重试
+    - 安装了 h2 时启用 HTTP/2
+    httpx.AsyncClient 绑定事件循环，因此每个事件循环各持一个底层客户端
+    """
+
+    def __init__(self, timeout=5, max_connections=100, max_keepalive_connections=20,
+                 keepalive_expiry=30, retries=2, backoff=0.3, http2=True):
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> httpx.AsyncClient
+
+    @classmethod
+    def from_config(cls, config_path="configs/http.yaml"):
+        path = Path(config_path)
+        config = yaml.safe_load(path.open()) if path.exists() else {}
+        return cls(**(config or {}))
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                follow_redirects=True
+            )
+            self._clients[loop] = client
+        return client
+
+    async def request(self, method, url, **kwargs):
+        client = self._client()
+        for attempt in range(self.retries + 1):
+            try:
+                res = await client.request(method, url, **kwargs)
+                if res.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return res
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def aclose(self):
+        """关闭当前事件循环上的底层客户端"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+def check_upstream(res):
+    """上游返回 5xx 时抛出 httpx.HTTPStatusError（按上游故障处理）；其他状态码由插件自己解释"""
+    if res.status_code >= 500:
+        res.raise_for_status()
+    return res
+
+
+def is_upstream_failure(error):
+    """连接错误、超时和 5xx 属于上游故障；参数错误、未找到、解析失败等不算"""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code >= 500
+
+
+def error_result(error, **fields):
+    """把插件捕获的异常转换为错误结果；上游故障带 upstream_error 标记，供熔断器统计（见 mcp/resilience.py）"""
+    result = {"error": str(error), **fields}
+    if is_upstream_failure(error):
+        result["upstream_error"] = True
+    return result
+
+
+_default_client = None
+
+
+def get_http(args=None):
+    """
+    返回框架注入的 HTTP 客户端；插件被单独调用（如 __main__ 测试）时退回到进程级默认客户端
+    """
+    global _default_client
+    http = (args or {}).get("__http__")
+    if http is not None:
+        return http
+    if _default_client is None:
+        _default_client = HttpClient.from_config()
+    return _default_client
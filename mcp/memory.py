@@ -3,14 +3,219 @@
 # Author: Shibo Li
 # Date: 2025-04-25
 
+import asyncio
+import heapq
+import itertools
+import sqlite3
+import threading
+import time
+import yaml
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+from mcp.decision_cache import char_ngrams, normalize_input
+from mcp.session import current_session_id
+
+
+class _SessionMemory:
+    """单个会话的记忆：环形缓冲 + n-gram 倒排索引"""
+
+    def __init__(self, max_entries, ngram):
+        self.entries = deque()  # seq
+        self.texts = {}  # seq -> summary
+        self.index = defaultdict(set)  # gram -> {seq}
+        self.grams = {}  # seq -> grams
+        self.max_entries = max_entries
+        self.ngram = ngram
+        self.next_seq = 0
+
+    def append(self, summary, seq=None):
+        seq = self.next_seq if seq is None else seq
+        self.next_seq = seq + 1
+        grams = char_ngrams(normalize_input(summary), self.ngram)
+        self.entries.append(seq)
+        self.texts[seq] = summary
+        self.grams[seq] = grams
+        for gram in grams:
+            self.index[gram].add(seq)
+
+        while len(self.entries) > self.max_entries:
+            old_seq = self.entries.popleft()
+            self.texts.pop(old_seq, None)
+            for gram in self.grams.pop(old_seq, ()):
+                postings = self.index.get(gram)
+                if postings is not None:
+                    postings.discard(old_seq)
+                    if not postings:
+                        del self.index[gram]
+        return seq
+
+
 class MemoryStore:
-    def __init__(self):
-        self.entries = []
+    """
+    按会话划分的记忆存储；未显式指定 session_id 时使用当前活动会话
+    - 每个会话最多保留 max_entries 条（环形缓冲），内存中最多保留 max_sessions 个会话（LRU）
+    - 可选 sqlite 追加日志：重启后按需加载某个会话最近的 max_entries 条，而不是一次性全部载入
+    - search() 通过 n-gram 倒排索引检索相关的历史记录，只访问查询命中的倒排表
+    - 异步管线使用 aadd()：读写 sqlite 放到线程中执行，不阻塞事件循环；读磁盘时不持有锁
+    """
+
+    def __init__(self, max_entries=200, max_sessions=10000, sqlite_path=None, ngram=2):
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self.ngram = ngram
+        self._sessions = OrderedDict()  # session_id -> _SessionMemory
+        self._versions = {}
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+
+        self.sqlite_path = Path(sqlite_path) if sqlite_path else None
+        self._local = threading.local()
+        if self.sqlite_path:
+            self.sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = self._conn()
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS memory ("
+                    "session_id TEXT, seq INTEGER, summary TEXT, created_at REAL, "
+                    "PRIMARY KEY (session_id, seq))"
+                )
+
+    @classmethod
+    def from_config(cls, config_path="configs/memory.yaml"):
+        path = Path(config_path)
+        config = yaml.safe_load(path.open()) if path.exists() else {}
+        config = config or {}
+        return cls(
+            max_entries=config.get("max_entries", 200),
+            max_sessions=config.get("max_sessions", 10000),
+            sqlite_path=config.get("sqlite_path") if config.get("persist") else None
+        )
+
+    def _conn(self):
+        # sqlite 连接不能跨线程共享，每个线程各持一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.sqlite_path), timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def reset_connections(self):
+        """丢弃从父进程继承的 sqlite 连接（pre-fork 模式下 worker 启动时调用），之后按需重新打开"""
+        self._local = threading.local()
 
-    def add(self, summary: str):
-        """添加一条摘要到记忆中"""
-        self.entries.append(summary)
+    def _cached(self, session_id):
+        """内存中的会话记忆（调用方持有锁），没有时返回 None"""
+        memory = self._sessions.get(session_id)
+        if memory is not None:
+            self._sessions.move_to_end(session_id)
+        return memory
 
-    def get_recent(self, max_entries=5):
+    def _read(self, session_id):
+        """从磁盘日志读取会话最近的 max_entries 条（不持有锁）"""
+        if not self.sqlite_path:
+            return []
+        rows = self._conn().execute(
+            "SELECT seq, summary FROM memory WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.max_entries)
+        ).fetchall()
+        return list(reversed(rows))
+
+    def _install(self, session_id, rows):
+        """把读到的记录放入内存（调用方持有锁）；其他线程已先放入时沿用已有的"""
+        memory = self._cached(session_id)
+        if memory is not None:
+            return memory
+        memory = _SessionMemory(self.max_entries, self.ngram)
+        for seq, summary in rows:
+            memory.append(summary, seq=seq)
+        self._sessions[session_id] = memory
+        self._versions[session_id] = next(self._clock)
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._versions.pop(evicted, None)
+        return memory
+
+    def _session(self, session_id, create=True):
+        with self._lock:
+            memory = self._cached(session_id)
+        if memory is not None or (not create and self.sqlite_path is None):
+            return memory
+        rows = self._read(session_id)
+        with self._lock:
+            return self._install(session_id, rows)
+
+    async def _asession(self, session_id):
+        with self._lock:
+            memory = self._cached(session_id)
+        if memory is not None:
+            return memory
+        rows = await asyncio.to_thread(self._read, session_id) if self.sqlite_path else []
+        with self._lock:
+            return self._install(session_id, rows)
+
+    def _append(self, memory, session_id, summary):
+        with self._lock:
+            seq = memory.append(summary)
+            self._versions[session_id] = next(self._clock)
+        return seq
+
+    def _write(self, session_id, seq, summary):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO memory (session_id, seq, summary, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, seq, summary, time.time())
+            )
+
+    def add(self, summary: str, session_id=None, persist=True):
+        """添加一条摘要到记忆中；persist=False 时不写入磁盘日志（如一次性会话）"""
+        session_id = session_id or current_session_id()
+        seq = self._append(self._session(session_id), session_id, summary)
+        if self.sqlite_path and persist:
+            self._write(session_id, seq, summary)
+
+    async def aadd(self, summary: str, session_id=None, persist=True):
+        """add 的异步版本：加载会话和写入磁盘日志都在线程中执行"""
+        session_id = session_id or current_session_id()
+        seq = self._append(await self._asession(session_id), session_id, summary)
+        if self.sqlite_path and persist:
+            await asyncio.to_thread(self._write, session_id, seq, summary)
+
+    def version(self, session_id=None):
+        """记忆的版本号（会话 ID + 全局递增序号），可作为记忆模块的 version_fn"""
+        session_id = session_id or current_session_id()
+        return session_id, self._versions.get(session_id, 0)
+
+    def get_recent(self, max_entries=5, session_id=None):
         """返回最近的 N 条记忆"""
-        return self.entries[-max_entries:]
+        memory = self._session(session_id or current_session_id(), create=False)
+        if memory is None:
+            return []
+        with self._lock:
+            return [memory.texts[seq] for seq in list(memory.entries)[-max_entries:]]
+
+    def search(self, query: str, k=3, session_id=None):
+        """按 n-gram 重合度检索最相关的 k 条记忆（同分时较新的优先）"""
+        grams = char_ngrams(normalize_input(query), self.ngram)
+        memory = self._session(session_id or current_session_id(), create=False)
+        if memory is None or not grams:
+            return []
+        with self._lock:
+            scores = defaultdict(int)
+            for gram in grams:
+                for seq in memory.index.get(gram, ()):
+                    scores[seq] += 1
+            best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], item[0]))
+            return [memory.texts[seq] for seq, _ in best]
+
+    def discard(self, session_id, from_disk=True):
+        """丢弃某个会话的全部记忆（一次性会话结束时调用）；from_disk=False 时保留磁盘日志"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._versions.pop(session_id, None)
+        if self.sqlite_path and from_disk:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM memory WHERE session_id = ?", (session_id,))
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 运行指标：计数器、直方图和 Prometheus 文本格式输出（api_server.py 的 /metrics）
+# - MCPContext 记录各阶段耗时、每个工具的耗时与结果、模型 token 用量
+# - 插件可用 span(name) 记录自己的耗时：
+#       from mcp.metrics import span
+#       with span("geocode.opencage"):
+#           ...
+# 指标按进程统计，多 worker 部署时由 Prometheus 分别抓取后聚合
+
+import bisect
+import contextlib
+import threading
+import time
+from collections import defaultdict
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = defaultdict(dict)  # name -> {labels: value}
+        self._histograms = defaultdict(dict)  # name -> {labels: _Histogram}
+        self._help = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, labels=None, value=1):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = _labels_key(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """记录代码块耗时（秒）到直方图 name；同步和异步代码中都可使用"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def span(self, name):
+        return self.timer("mcp_span_seconds", span=name)
+
+    def add_collector(self, name, collector):
+        """
+        注册在输出时才读取的指标（如各缓存自己维护的计数器）；同名 collector 后注册的覆盖先注册的
+        collector() 返回 [(指标名, "counter" | "gauge", 说明, [(labels, value), ...]), ...]
+        """
+        self._collectors[name] = collector
+
+    def snapshot(self):
+        """当前计数器和直方图的汇总（便于调试和基准测试）"""
+        with self._lock:
+            counters = {
+                name: {_format_labels(key) or "": value for key, value in series.items()}
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: {
+                    _format_labels(key) or "": {"count": h.count, "sum": round(h.sum, 6)}
+                    for key, h in series.items()
+                }
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+
+        def header(name, kind):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _format_value(float(bound))
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(h.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+
+        for collector in list(self._collectors.values()):
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_labels_key(labels))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# 进程级默认实例：MCPContext 和插件共用
+registry = MetricsRegistry()
+registry.describe("mcp_stage_seconds", "build_prompt 各阶段耗时（秒）")
+registry.describe("mcp_tool_seconds", "工具调用耗时（秒，含缓存命中）")
+registry.describe("mcp_tool_calls_total", "工具调用次数（按结果 ok/error/timeout/cancelled）")
+registry.describe("mcp_llm_seconds", "模型调用耗时（秒）")
+registry.describe("mcp_llm_tokens_total", "模型 token 用量（取自接口返回的 usage）")
+registry.describe("mcp_llm_cache_total", "规划阶段模型调用缓存命中/未命中次数")
+registry.describe("mcp_span_seconds", "插件自定义 span 耗时（秒）")
+
+
+def span(name):
+    """插件使用的自定义耗时记录：with span("name"): ..."""
+    return registry.span(name)
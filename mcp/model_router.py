@@ -17,7 +17,8 @@ class ModelRouter:
         self.routes = {
             "intent_decision": "deepseek-reasoner",
             "tool_decision": "deepseek-reasoner",
-            "final_response": "deepseek-chat"
+            "final_response": "deepseek-chat",
+            "planner": {"mode": "two_step", "model": "deepseek-chat", "fast_path_max_modules": 0}
         }
 
         # 如果存在 config 文件，则加载并覆盖默认设置
@@ -29,8 +30,26 @@ class ModelRouter:
         """
         获取指定任务应该使用的模型
         例如 task = "tool_decision" → 返回 deepseek-chat
+        路由也可以写成字典（如 planner），此时取其中的 model 字段
         """
-        return self.routes.get(task, "deepseek-chat")
+        route = self.routes.get(task, "deepseek-chat")
+        if isinstance(route, dict):
+            return route.get("model", "deepseek-chat")
+        return route
+
+    def get_options(self, task: str):
+        """
+        获取路由的附加选项（字典形式的路由），不存在时返回空字典
+        例如 task = "planner" → {"mode": "two_step", "fast_path_max_modules": 2, ...}
+        """
+        route = self.routes.get(task)
+        return route if isinstance(route, dict) else {}
+
+    def get_tokenizer_for(self, model: str):
+        """
+        获取模型对应的本地分词器文件路径（configs/router.yaml 的 tokenizers 路由），未配置时返回 None
+        """
+        return self.get_options("tokenizers").get(model)
 
 if __name__ == "__main__":
     # 测试 ModelRouter
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 上下文打包：在 token 预算内选出优先级总和最大的模块组合
+# - 选中一个模块时必须同时选中它依赖的全部模块（deps 闭包）
+# - 模块数不超过 exact_limit 时用分支定界（分数背包上界）精确求解，否则用贪心 + 最优单闭包的近似解（不保证最优）
+# - 放不下的模块如果声明了 overflow（"truncate" 或摘要函数），用剩余预算放入缩短后的版本
+
+MIN_OVERFLOW_TOKENS = 16
+TRUNCATED_SUFFIX = "\n…（已截断）"
+
+
+def dependency_closures(module_data):
+    """返回 模块名 -> 依赖闭包（包含自身）；未注册的依赖忽略"""
+    by_name = {m["name"]: m for m in module_data}
+    closures = {}
+    for name in by_name:
+        closure, stack = set(), [name]
+        while stack:
+            current = stack.pop()
+            if current in closure or current not in by_name:
+                continue
+            closure.add(current)
+            stack.extend(by_name[current]["deps"])
+        closures[name] = closure
+    return closures
+
+
+def _exact(module_data, budget, closures):
+    """
+    分支定界：按优先级从高到低依次决定每个模块选（连同依赖闭包）或不选，
+    上界为剩余模块的分数背包解（按 优先级/token 装入，最后一个按比例计入；忽略依赖只会使上界更松）
+    """
+    by_name = {m["name"]: m for m in module_data}
+    order = [m["name"] for m in sorted(module_data, key=lambda m: -m["priority"])]
+    position = {name: i for i, name in enumerate(order)}
+    dense = sorted(order, key=lambda n: -by_name[n]["priority"] / by_name[n]["tokens"] if by_name[n]["tokens"] else float("-inf"))
+    integral = all(float(m["priority"]).is_integer() for m in module_data)
+    best = {"value": -1, "selected": frozenset()}
+
+    def upper_bound(i, selected, capacity):
+        bound = 0.0
+        for name in dense:
+            if position[name] < i or name in selected:
+                continue
+            m = by_name[name]
+            if m["tokens"] <= capacity:
+                bound += m["priority"]
+                capacity -= m["tokens"]
+            else:
+                bound += m["priority"] * capacity / m["tokens"]
+                break
+        # 优先级都是整数时，能达到的总和也是整数
+        return int(bound + 1e-9) if integral else bound
+
+    def search(i, selected, excluded, used, value):
+        if value > best["value"]:
+            best.update(value=value, selected=selected)
+        if i == len(order) or value + upper_bound(i, selected, budget - used) <= best["value"]:
+            return
+        name = order[i]
+        if name in selected:
+            search(i + 1, selected, excluded, used, value)
+            return
+        added = closures[name] - selected
+        cost = sum(by_name[n]["tokens"] for n in added)
+        if used + cost <= budget and not added & excluded:
+            gain = sum(by_name[n]["priority"] for n in added)
+            search(i + 1, selected | added, excluded, used + cost, value + gain)
+        search(i + 1, selected, excluded | {name}, used, value)
+
+    search(0, frozenset(), frozenset(), 0, 0)
+    return set(best["selected"])
+
+
+def _approximate(module_data, budget, closures):
+    by_name = {m["name"]: m for m in module_data}
+
+    def cost_and_value(names):
+        return sum(by_name[n]["tokens"] for n in names), sum(by_name[n]["priority"] for n in names)
+
+    # 贪心：每次加入“新增优先级 / 新增 token”最高且放得下的闭包
+    selected, used = set(), 0
+    while True:
+        best_name, best_density = None, -1.0
+        for name, closure in closures.items():
+            added = closure - selected
+            if not added:
+                continue
+            cost, value = cost_and_value(added)
+            if used + cost > budget:
+                continue
+            density = value / max(cost, 1)
+            if density > best_density:
+                best_name, best_density = name, density
+        if best_name is None:
+            break
+        added = closures[best_name] - selected
+        selected |= added
+        used += cost_and_value(added)[0]
+
+    # 与放得下的最优单个闭包比较，避免贪心被一个高密度的小闭包带偏
+    single = max(
+        (closure for closure in closures.values() if cost_and_value(closure)[0] <= budget),
+        key=lambda closure: cost_and_value(closure)[1],
+        default=set()
+    )
+    if cost_and_value(single)[1] > cost_and_value(selected)[1]:
+        return set(single)
+    return selected
+
+
+def truncate_text(text, max_tokens, count_fn):
+    """按 token 数截断文本（二分查找保留的字符数）"""
+    if count_fn(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_fn(text[:mid] + TRUNCATED_SUFFIX) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + TRUNCATED_SUFFIX if low else ""
+
+
+def pack_modules(module_data, budget, count_fn, exact_limit=16):
+    """
+    module_data: MCPContext._evaluate_modules 的结果（含 name/priority/tokens/deps/text，可选 overflow）
+    返回按优先级从高到低排列的入选模块列表；被缩短的模块返回替换了 text/tokens 的副本
+    """
+    closures = dependency_closures(module_data)
+    if len(module_data) <= exact_limit:
+        selected = _exact(module_data, budget, closures)
+    else:
+        selected = _approximate(module_data, budget, closures)
+
+    packed = [m for m in module_data if m["name"] in selected]
+    used = sum(m["tokens"] for m in packed)
+
+    # 放不下的模块：依赖已全部入选且声明了 overflow 的，用剩余预算放入截断/摘要版本
+    for m in sorted(module_data, key=lambda m: -m["priority"]):
+        remaining = budget - used
+        if remaining < MIN_OVERFLOW_TOKENS:
+            break
+        overflow = m.get("overflow")
+        if m["name"] in selected or not overflow or not closures[m["name"]] - {m["name"]} <= selected:
+            continue
+        if callable(overflow):
+            text = overflow(m["text"], remaining)
+            text = truncate_text(text, remaining, count_fn) if text else ""
+        else:
+            text = truncate_text(m["text"], remaining, count_fn)
+        if text:
+            tokens = count_fn(text)
+            packed.append(dict(m, text=text, tokens=tokens))
+            selected.add(m["name"])
+            used += tokens
+
+    packed.sort(key=lambda m: -m["priority"])
+    return packed
@@ -4,21 +4,171 @@
 # Date: 2025-04-25
 
 
+import hashlib
 import importlib
+import inspect
+import json
 import pkgutil
+from pathlib import Path
 import mcp.tools as tool_pkg  # 👈 关键：这是 Python 包，不是上下文对象
 
-def register_all_tools(mcp):
+# 插件清单：记录每个插件注册的工具（名称、描述、参数、实现位置），启动时无需导入插件代码
+# 修改插件后运行 `python -m mcp.registry` 重新生成
+MANIFEST_PATH = Path(tool_pkg.__path__[0]) / "manifest.json"
+
+
+def _plugin_files():
+    """返回 插件模块名 -> 源文件内容哈希（不导入插件）"""
+    files = {}
+    for module_info in pkgutil.iter_modules(tool_pkg.__path__, tool_pkg.__name__ + "."):
+        if module_info.ispkg:
+            continue
+        path = Path(module_info.module_finder.path) / (module_info.name.split(".")[-1] + ".py")
+        if path.exists():
+            files[module_info.name] = hashlib.sha1(path.read_bytes()).hexdigest()
+    return files
+
+
+class _RecordingMCP:
+    """
+    生成清单时代替 MCPContext 传给插件的 register(mcp)，只记录 register_tool_function 调用
+    插件调用了其他方法（如 register_module）时标记为需要在启动时导入
+    """
+
+    def __init__(self):
+        self.tools = []
+        self.eager = False
+
+    def register_tool_function(self, name, description, parameters, func=None, **kwargs):
+        self.tools.append({
+            "name": name,
+            "description": description,
+            "parameters": parameters,
+            "func": func,
+            "options": kwargs
+        })
+
+    def __getattr__(self, attr):
+        self.eager = True
+        return lambda *args, **kwargs: None
+
+
+def build_manifest(path=MANIFEST_PATH):
+    """导入全部插件，记录其注册的工具并写入清单文件"""
+    manifest = {"files": _plugin_files(), "plugins": {}}
+    for name in manifest["files"]:
+        module = importlib.import_module(name)
+        if not hasattr(module, "register"):
+            continue
+        recorder = _RecordingMCP()
+        module.register(recorder)
+
+        tools = []
+        for tool in recorder.tools:
+            func = tool["func"]
+            if func is not None and getattr(importlib.import_module(func.__module__), func.__name__, None) is not func:
+                # 实现函数不是模块级属性，无法按名称延迟加载
+                recorder.eager = True
+                break
+            tools.append({
+                "name": tool["name"],
+                "description": tool["description"],
+                "parameters": tool["parameters"],
+                "options": tool["options"],
+                "func": None if func is None else {
+                    "module": func.__module__,
+                    "attr": func.__name__,
+                    "async": inspect.iscoroutinefunction(func)
+                }
+            })
+        manifest["plugins"][name] = {"eager": recorder.eager, "tools": [] if recorder.eager else tools}
+
+    Path(path).write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    return manifest
+
+
+def _lazy_func(spec):
+    """按清单中的位置在首次调用时导入插件实现，保持原函数的同步/异步形态"""
+    def load():
+        return getattr(importlib.import_module(spec["module"]), spec["attr"])
+
+    if spec["async"]:
+        async def lazy(arguments):
+            return await load()(arguments)
+    else:
+        def lazy(arguments):
+            return load()(arguments)
+    lazy.__name__ = spec["attr"]
+    return lazy
+
+
+def _load_manifest(path=MANIFEST_PATH):
+    """读取清单；清单不存在或插件文件已变化时返回 None"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except ValueError:
+        return None
+    if manifest.get("files") != _plugin_files():
+        print("[WARN] 插件清单已过期，改为直接导入插件（运行 python -m mcp.registry 重新生成）")
+        return None
+    return manifest
+
+
+def _register_module(mcp, name):
+    try:
+        module = importlib.import_module(name)
+        if hasattr(module, "register"):
+            module.register(mcp)
+            print(f"[PLUGIN] 已加载插件：{name.split('.')[-1]}")
+    except Exception as e:
+        print(f"[ERROR] 加载插件失败：{name} -> {e}")
+
+
+def register_all_tools(mcp, lazy=True):
     """
     自动注册 mcp.tools 目录下的所有插件模块（包含 register(mcp) 方法）
+    lazy=True 且清单有效时只按清单注册工具描述，插件代码在首次调用时才导入
+    """
+    manifest = _load_manifest() if lazy else None
+    if manifest is None:
+        for _, name, is_pkg in pkgutil.iter_modules(tool_pkg.__path__, tool_pkg.__name__ + "."):
+            if is_pkg:
+                continue
+            _register_module(mcp, name)
+        return
+
+    for name, plugin in manifest["plugins"].items():
+        if plugin["eager"]:
+            _register_module(mcp, name)
+            continue
+        for tool in plugin["tools"]:
+            mcp.register_tool_function(
+                name=tool["name"],
+                description=tool["description"],
+                parameters=tool["parameters"],
+                func=_lazy_func(tool["func"]) if tool["func"] else None,
+                **tool["options"]
+            )
+        print(f"[PLUGIN] 已注册插件（延迟加载）：{name.split('.')[-1]}")
+
+
+def preload_plugins():
+    """
+    立即导入全部插件模块（不重复注册工具）
+    pre-fork 模式下在主进程中调用，worker 共享已导入的代码，避免每个 worker 在首次调用工具时各自导入
     """
     for _, name, is_pkg in pkgutil.iter_modules(tool_pkg.__path__, tool_pkg.__name__ + "."):
         if is_pkg:
             continue
         try:
-            module = importlib.import_module(name)
-            if hasattr(module, "register"):
-                module.register(mcp)
-                print(f"[PLUGIN] 已加载插件：{name.split('.')[-1]}")
+            importlib.import_module(name)
         except Exception as e:
-            print(f"[ERROR] 加载插件失败：{name} -> {e}")
+            print(f"[ERROR] 预加载插件失败：{name} -> {e}")
+
+
+if __name__ == "__main__":
+    manifest = build_manifest()
+    print(f"已生成插件清单：{MANIFEST_PATH}（{len(manifest['plugins'])} 个插件）")
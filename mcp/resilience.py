@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 工具调用的限流与熔断（配置见 configs/limits.yaml）
+# - TokenBucket: 令牌桶，每个工具一个，每个 API 密钥一个（同一密钥被多个工具共用时共享额度）
+# - CircuitBreaker: 窗口内上游故障率超过阈值后熔断，熔断期间直接失败，到期后放行一次试探调用
+#   只有上游故障（结果带 upstream_error 标记、超时、连接错误和 5xx 异常）计为失败，用户输入导致的错误（如地址未找到）不计
+# - ToolGuard: 包装工具函数；被限流或熔断时返回最近一次成功结果（标记 stale），没有则返回错误
+#   插件内部每次真正访问上游都要计额度时（如批量地理编码），通过注入的 arguments["__guard__"] 调用 aacquire_key
+
+import asyncio
+import functools
+import inspect
+import threading
+import time
+import yaml
+from collections import defaultdict, deque
+from pathlib import Path
+from mcp.cache import LRUCache, make_cache_key
+from mcp.http import is_upstream_failure
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """取一个令牌，返回需要等待的秒数；等待时间超过 max_wait 时不取令牌，返回 None"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def refund(self):
+        """归还 reserve 取走的令牌（同一次调用被后面的桶或熔断器拒绝时）"""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+class CircuitBreaker:
+    """closed -> (错误率超过阈值) -> open -> (open_seconds 后) -> half_open -> 试探成功 closed / 失败 open"""
+
+    def __init__(self, window=30, min_calls=5, error_rate=0.5, open_seconds=30):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._events = deque()  # (时间, 是否失败)
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"  # 只放行这一次试探调用
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "half_open":
+                if ok:
+                    self.state = "closed"
+                else:
+                    self.state, self.opened_at = "open", now
+                return
+
+            self._events.append((now, not ok))
+            self._failures += not ok
+            while self._events and now - self._events[0][0] > self.window:
+                self._failures -= self._events.popleft()[1]
+            if len(self._events) >= self.min_calls and self._failures / len(self._events) >= self.error_rate:
+                self.state, self.opened_at = "open", now
+                self._events.clear()
+                self._failures = 0
+
+
+def _failed(result):
+    return isinstance(result, dict) and bool(result.get("upstream_error"))
+
+
+class ToolGuard:
+    def __init__(self, config=None):
+        config = config or {}
+        self.defaults = config.get("defaults") or {}
+        self.breaker_config = config.get("breaker") or {}
+        self.tool_config = config.get("tools") or {}
+        self.key_buckets = {
+            key: TokenBucket(spec["rate"], spec.get("burst", 1))
+            for key, spec in (config.get("api_keys") or {}).items() if spec.get("rate")
+        }
+        self.stale = LRUCache(max_entries=self.breaker_config.get("stale_entries", 1024))
+        self.breakers = {}
+        self.buckets = {}
+        self.counters = defaultdict(lambda: {"rate_limited": 0, "circuit_open": 0, "stale_served": 0})
+
+    @classmethod
+    def from_config(cls, config_path="configs/limits.yaml"):
+        path = Path(config_path)
+        config = yaml.safe_load(path.open()) if path.exists() else {}
+        return cls(config or {})
+
+    def _options(self, name):
+        return dict(self.defaults, **(self.tool_config.get(name) or {}))
+
+    def _setup(self, name):
+        options = self._options(name)
+        breaker_options = {k: v for k, v in self.breaker_config.items()
+                           if k in ("window", "min_calls", "error_rate", "open_seconds")}
+        self.breakers[name] = CircuitBreaker(**breaker_options)
+        buckets = [self.key_buckets[key] for key in options.get("api_keys", []) if key in self.key_buckets]
+        if options.get("rate"):
+            buckets.insert(0, TokenBucket(options["rate"], options.get("burst", 1)))
+        self.buckets[name] = buckets
+        return options
+
+    def _admit(self, name, options):
+        """返回 (需等待的秒数, 拒绝原因)；被拒绝时归还已从前面的桶取走的令牌"""
+        wait = 0.0
+        taken = []
+        reason = None
+        for bucket in self.buckets[name]:
+            bucket_wait = bucket.reserve(options.get("max_wait", 1.0))
+            if bucket_wait is None:
+                reason = "rate_limited"
+                break
+            taken.append(bucket)
+            wait = max(wait, bucket_wait)
+        if reason is None and not self.breakers[name].allow():
+            reason = "circuit_open"
+        if reason:
+            for bucket in taken:
+                bucket.refund()
+            return 0.0, reason
+        return wait, None
+
+    async def aacquire_key(self, key, max_wait=None):
+        """
+        为一次上游请求取一个密钥令牌（不足时最多等待 max_wait 秒，默认取 defaults.max_wait）
+        返回 False 表示触发限流；没有为该密钥配置限流时直接返回 True
+        """
+        bucket = self.key_buckets.get(key)
+        if bucket is None:
+            return True
+        wait = bucket.reserve(self.defaults.get("max_wait", 1.0) if max_wait is None else max_wait)
+        if wait is None:
+            return False
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+    def _reject(self, name, arguments, reason):
+        self.counters[name][reason] += 1
+        hit, value = self.stale.get(make_cache_key(name, arguments))
+        if hit:
+            self.counters[name]["stale_served"] += 1
+            return dict(value, stale=True)
+        if reason == "rate_limited":
+            return {"error": f"工具 {name} 触发限流，请稍后再试"}
+        return {"error": f"工具 {name} 的上游服务暂时不可用（已熔断）"}
+
+    def _record(self, name, arguments, result):
+        self.breakers[name].record(not _failed(result))
+        if not (isinstance(result, dict) and "error" in result):
+            self.stale.set(make_cache_key(name, arguments), result, ttl=self.breaker_config.get("stale_ttl", 86400))
+
+    def wrap(self, name, func):
+        """返回带限流和熔断的工具函数（保持原函数的同步/异步形态）；func 为空时原样返回"""
+        if func is None:
+            return func
+        options = self._setup(name)
+        timeout = options.get("timeout")
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def guarded(arguments):
+                wait, reason = self._admit(name, options)
+                if reason:
+                    return self._reject(name, arguments, reason)
+                if wait:
+                    await asyncio.sleep(wait)
+                try:
+                    result = await asyncio.wait_for(func(arguments), timeout)
+                except asyncio.TimeoutError:
+                    result = {"error": f"工具 {name} 的上游请求超时（{timeout}s）", "upstream_error": True}
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.breakers[name].record(not is_upstream_failure(e))
+                    raise
+                self._record(name, arguments, result)
+                return result
+        else:
+            @functools.wraps(func)
+            def guarded(arguments):
+                wait, reason = self._admit(name, options)
+                if reason:
+                    return self._reject(name, arguments, reason)
+                if wait:
+                    time.sleep(wait)
+                try:
+                    result = func(arguments)
+                except Exception as e:
+                    self.breakers[name].record(not is_upstream_failure(e))
+                    raise
+                self._record(name, arguments, result)
+                return result
+
+        return guarded
+
+    def stats(self):
+        return {
+            name: dict(self.counters[name], state=breaker.state)
+            for name, breaker in self.breakers.items()
+        }
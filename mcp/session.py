@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 单次请求的上下文对象
+# MCPContext 只保存所有请求共享的只读部分（模型客户端、路由、工具表、api_keys、已注册模块），
+# 每次请求的可变状态（用户输入、工具调用结果模块、所属会话）放在 MCPSession 中，
+# 因此并发请求之间互不干扰，热路径上也不需要加锁
+
+import contextvars
+import uuid
+
+_current_session = contextvars.ContextVar("mcp_session", default=None)
+
+
+def module_entry(content_fn, priority=1, deps=None, description="", overflow=None, ttl=None, version_fn=None,
+                 encoder=None):
+    """
+    模块表中的一项
+    - version_fn: 返回模块内容版本的函数，版本不变时复用缓存的内容和格式化文本
+    - ttl: 内容缓存时间（秒）
+    两者都没有声明的模块，每次请求最多计算一次
+    - encoder: 字典内容的序列化格式（见 mcp/encoders.py），为空时按模型的配置选择
+    """
+    return {
+        "fn": content_fn,
+        "priority": priority,
+        "deps": deps or [],
+        "description": description,
+        "overflow": overflow,
+        "ttl": ttl,
+        "version_fn": version_fn,
+        "encoder": encoder
+    }
+
+
+class MCPSession:
+    """
+    单次请求的上下文
+    - session_id: 会话 ID，用于划分记忆等按会话保存的数据；为 None 时生成一次性会话
+    - modules: 共享模块表的浅拷贝，本次请求产生的工具结果只写入这里
+    - tool_names: 本次请求发给模型的工具名（None 表示全部）
+    - llm_cache: 模型调用结果缓存的使用方式 use / bypass / refresh（见 mcp/completion_cache.py）
+    """
+
+    def __init__(self, user_input, modules, session_id=None, tool_names=None, llm_cache="use"):
+        self.ephemeral = session_id is None
+        self.llm_cache = llm_cache or "use"
+        self.session_id = session_id or f"anon-{uuid.uuid4().hex}"
+        self.user_input = user_input
+        self.tool_names = tool_names
+        self.modules = dict(modules)
+        self.evaluated = {}  # 本次请求内已计算的模块：name -> 缓存槽
+        self.turn = 0  # 本次请求是该会话的第几轮（一次性会话为 0），用于工具结果的生命周期
+        self.tool_memo = None  # 批量请求中各会话共用的 {调用键: Task}，相同的工具调用只执行一次
+        self.events = None  # 流式请求时为 asyncio.Queue，管线事件写入其中
+
+    def register_module(self, name, content_fn, priority=1, deps=None, description="", overflow=None,
+                        ttl=None, version_fn=None, encoder=None):
+        """注册仅对本次请求可见的模块（如工具调用结果）"""
+        self.modules[name] = module_entry(content_fn, priority, deps, description, overflow, ttl, version_fn,
+                                          encoder)
+        self.evaluated.pop(name, None)
+
+    def emit(self, event, data):
+        """发出管线事件（仅流式请求会收集）"""
+        if self.events is not None:
+            self.events.put_nowait((event, data))
+
+    def activate(self):
+        """将本会话设为当前协程/线程的活动会话，返回用于恢复的 token"""
+        return _current_session.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current_session.reset(token)
+
+
+def current_session():
+    """返回当前活动的 MCPSession（没有时为 None）"""
+    return _current_session.get()
+
+
+def current_session_id(default="default"):
+    session = _current_session.get()
+    return session.session_id if session else default
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 相同工具调用合并（singleflight）
+# 并发的、工具名和规范化参数都相同的调用只向上游发出一次请求，其余调用等待并共享同一结果
+# 键与工具缓存相同（make_cache_key），以 __ 开头的注入参数（如 __api_keys__）不参与计算
+
+import asyncio
+import functools
+import inspect
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from mcp.cache import make_cache_key
+
+
+class SingleFlight:
+    """
+    进行中的调用以 concurrent.futures.Future 登记，因此同步接口的后台事件循环、
+    uvicorn 的事件循环和同步插件所在的线程池之间都可以互相合并
+    """
+
+    def __init__(self):
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"calls": 0, "shared": 0})
+
+    def _join(self, name, key):
+        """返回 (Future, 是否为发起者)"""
+        with self._lock:
+            self.counters[name]["calls"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters[name]["shared"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def ado(self, name, func, arguments):
+        key = make_cache_key(name, arguments)
+        future, leader = self._join(name, key)
+        if not leader:
+            # shield：某个等待者超时被取消时不影响进行中的上游调用
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        # 上游调用放在独立任务中，发起者被取消（如单次调用超时）时其他等待者仍能拿到结果
+        task = asyncio.ensure_future(func(arguments))
+
+        def done(task):
+            if task.cancelled():
+                self._finish(key, future, error=asyncio.CancelledError())
+            else:
+                self._finish(key, future, result=None if task.exception() else task.result(),
+                             error=task.exception())
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def do(self, name, func, arguments):
+        key = make_cache_key(name, arguments)
+        future, leader = self._join(name, key)
+        if not leader:
+            return future.result()
+        try:
+            result = func(arguments)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def wrap(self, name, func):
+        """返回合并相同并发调用的工具函数（保持原函数的同步/异步形态）；func 为空时原样返回"""
+        if func is None:
+            return func
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def coalesced(arguments):
+                return await self.ado(name, func, arguments)
+        else:
+            @functools.wraps(func)
+            def coalesced(arguments):
+                return self.do(name, func, arguments)
+
+        return coalesced
+
+    def stats(self):
+        return {
+            "inflight": len(self._inflight),
+            "tools": {name: dict(c) for name, c in self.counters.items()}
+        }
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# token 计数
+# - HeuristicTokenizer: 无需任何文件的估算（中日韩字符按 1 token/字，其余按 4 字符/token）
+# - HFTokenizer: 从本地 tokenizer.json 加载 BPE 分词器（需要安装 tokenizers）
+# - TokenCounter: 按模型选择分词器（见 configs/router.yaml 的 tokenizers 路由），并按内容哈希缓存计数结果
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    # 简化估算：中文等字符大约 1 token/字，其余按 4 字符/token
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+
+class HeuristicTokenizer:
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+
+class HFTokenizer:
+    """从本地 tokenizer.json（HuggingFace 格式，DeepSeek 等模型随权重发布）加载"""
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+        self.name = f"hf:{path}"
+        self._tokenizer = Tokenizer.from_file(str(path))
+
+    def count(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def load_tokenizer(path):
+    """加载本地分词器文件，失败时退回估算分词器"""
+    if path and Path(path).exists():
+        try:
+            return HFTokenizer(path)
+        except Exception as e:
+            print(f"[WARN] 加载分词器失败：{path} -> {e}，使用估算分词器")
+    elif path:
+        print(f"[WARN] 未找到分词器文件：{path}，使用估算分词器")
+    return HeuristicTokenizer()
+
+
+class TokenCounter:
+    """
+    按模型选择分词器并缓存计数结果
+    缓存键为 (分词器, 文本哈希)，内容不变的模块不会被重复计数
+    """
+
+    def __init__(self, router=None, max_entries=4096):
+        self.router = router
+        self.max_entries = max_entries
+        self._tokenizers = {}
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tokenizer_for(self, model=None):
+        tokenizer = self._tokenizers.get(model)
+        if tokenizer is None:
+            path = self.router.get_tokenizer_for(model) if self.router and model else None
+            tokenizer = load_tokenizer(path)
+            self._tokenizers[model] = tokenizer
+        return tokenizer
+
+    def count(self, text: str, model=None) -> int:
+        tokenizer = self.tokenizer_for(model)
+        key = (tokenizer.name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+
+        tokens = tokenizer.count(text)
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
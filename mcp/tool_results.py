@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 工具调用结果的生命周期管理（配置见 configs/memory.yaml 的 tool_results 部分）
+# - 每个结果属于某个会话的某一轮，在之后 max_turns 轮内、且未超过 ttl 时仍作为上下文模块提供给模型
+# - 整个 MCPContext 最多保留 max_entries 条结果，超出后按最近使用淘汰（LRU）
+# - 注册为模块前先压缩：去掉 raw 等大字段，截断过长的字符串和列表，使单个结果不超过 max_chars 字符
+
+import json
+import threading
+import time
+import yaml
+from collections import OrderedDict
+from pathlib import Path
+
+
+def compact(value, max_chars=2000, drop_keys=("raw",), max_items=20, max_str=500):
+    """压缩工具结果；max_chars 为 0 时只去掉 drop_keys 字段"""
+    def walk(v, max_items, max_str):
+        # max_items / max_str 为 None 表示不限制
+        if isinstance(v, dict):
+            return {k: walk(x, max_items, max_str) for k, x in v.items() if k not in drop_keys}
+        if isinstance(v, (list, tuple)):
+            limit = len(v) if max_items is None else max_items
+            items = [walk(x, max_items, max_str) for x in v[:limit]]
+            if len(v) > limit:
+                items.append(f"…（另有 {len(v) - limit} 项）")
+            return items
+        if isinstance(v, str) and max_str is not None and len(v) > max_str:
+            return v[:max_str] + "…"
+        return v
+
+    if not max_chars:
+        return walk(value, None, None)
+    result = walk(value, max_items, max_str)
+    # 仍然超长时逐步收紧，直到放得下或已收紧到底
+    while len(json.dumps(result, ensure_ascii=False, default=str)) > max_chars and (max_str > 20 or max_items > 1):
+        max_str, max_items = max(20, max_str // 2), max(1, max_items // 2)
+        result = walk(value, max_items, max_str)
+    return result
+
+
+class ToolResultStore:
+    def __init__(self, max_entries=256, ttl=600, max_turns=3, max_chars=2000, drop_keys=("raw",)):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.drop_keys = tuple(drop_keys)
+        self._entries = OrderedDict()  # (session_id, tool name) -> {"turn", "result", "expires_at"}
+        self._turns = OrderedDict()  # session_id -> 当前轮次
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_path="configs/memory.yaml"):
+        path = Path(config_path)
+        config = yaml.safe_load(path.open()) if path.exists() else {}
+        config = (config or {}).get("tool_results") or {}
+        return cls(**config)
+
+    def compact(self, result):
+        return compact(result, self.max_chars, self.drop_keys)
+
+    def begin_turn(self, session_id):
+        """会话开始新的一轮，返回轮次编号"""
+        with self._lock:
+            turn = self._turns.pop(session_id, 0) + 1
+            self._turns[session_id] = turn
+            while len(self._turns) > self.max_entries * 4:
+                self._turns.popitem(last=False)
+            return turn
+
+    def put(self, session_id, turn, name, result):
+        """保存（已压缩的）结果；同一会话同一工具只保留最新一次"""
+        key = (session_id, name)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = {
+                "turn": turn,
+                "result": result,
+                "expires_at": time.time() + self.ttl if self.ttl else None
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def active(self, session_id, turn):
+        """返回 [(工具名, 结果)]：本会话之前轮次中仍在生命周期内的结果"""
+        now = time.time()
+        results = []
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == session_id]:
+                entry = self._entries[key]
+                expired = entry["expires_at"] is not None and entry["expires_at"] < now
+                if expired or turn - entry["turn"] > self.max_turns:
+                    del self._entries[key]
+                    continue
+                if entry["turn"] < turn:
+                    self._entries.move_to_end(key)
+                    results.append((key[1], entry["result"]))
+        return results
+
+    def discard(self, session_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == session_id]:
+                del self._entries[key]
+            self._turns.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._entries)
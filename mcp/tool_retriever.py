@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 工具预筛选：在本地按相关度对已注册工具排序，只把 top-k 工具的 schema 发给 tool_decision 模型，
+# 使工具判断调用的 prompt 长度不随插件数量线性增长
+# - BM25：索引工具名、描述和参数描述（英文按单词，中文按字符二元组）
+# - embed_fn：可选的本地向量函数 text -> list[float]，与 BM25 分数加权融合
+# - 召回率：evaluate() 用标注样本离线评估；shadow_rate 抽样发送全部工具，在线统计 top-k 是否覆盖模型实际调用的工具
+
+import math
+import random
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    terms = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _tool_text(schema):
+    function = schema["function"]
+    params = function["parameters"]["properties"]
+    parts = [function["name"], function["name"].replace("_", " "), function["description"]]
+    for name, spec in params.items():
+        parts.append(name)
+        parts.append(spec.get("description", "") if isinstance(spec, dict) else "")
+    return " ".join(parts)
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ToolRetriever:
+    def __init__(self, k1=1.5, b=0.75, embed_fn=None, embed_weight=0.5, shadow_rate=0.0):
+        self.k1 = k1
+        self.b = b
+        self.embed_fn = embed_fn
+        self.embed_weight = embed_weight
+        self.shadow_rate = shadow_rate
+        self._version = None
+        self._index = None
+        self._lock = threading.Lock()
+        self.shadow_requests = 0
+        self.shadow_covered = 0
+
+    def ensure_index(self, tool_schema):
+        """工具表变化（ToolSchema 版本变化）时重建索引"""
+        if self._version == tool_schema.version:
+            return
+        docs = {s["function"]["name"]: _tool_text(s) for s in tool_schema.tools}
+        term_freqs = {name: Counter(tokenize(text)) for name, text in docs.items()}
+        doc_freq = Counter(term for tf in term_freqs.values() for term in tf)
+        lengths = {name: sum(tf.values()) for name, tf in term_freqs.items()}
+        n = len(docs)
+        index = {
+            "term_freqs": term_freqs,
+            "idf": {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()},
+            "lengths": lengths,
+            "avg_length": sum(lengths.values()) / n if n else 0.0,
+            "vectors": {name: self.embed_fn(text) for name, text in docs.items()} if self.embed_fn else {}
+        }
+        with self._lock:
+            self._index, self._version = index, tool_schema.version
+
+    def rank(self, query):
+        """返回 [(工具名, 分数)]，按分数从高到低"""
+        index = self._index
+        if not index:
+            return []
+        terms = Counter(tokenize(query))
+        scores = {}
+        for name, tf in index["term_freqs"].items():
+            norm = self.k1 * (1 - self.b + self.b * index["lengths"][name] / (index["avg_length"] or 1))
+            scores[name] = sum(
+                index["idf"][t] * tf[t] * (self.k1 + 1) / (tf[t] + norm) * qf
+                for t, qf in terms.items() if t in tf
+            )
+
+        if self.embed_fn is not None:
+            top = max(scores.values(), default=0.0) or 1.0
+            query_vector = self.embed_fn(query)
+            scores = {
+                name: (1 - self.embed_weight) * score / top
+                + self.embed_weight * _cosine(query_vector, index["vectors"][name])
+                for name, score in scores.items()
+            }
+        # 同分时保持注册顺序
+        order = {name: i for i, name in enumerate(index["term_freqs"])}
+        return sorted(scores.items(), key=lambda item: (-item[1], order[item[0]]))
+
+    def top_k(self, query, k):
+        return [name for name, _ in self.rank(query)[:k]]
+
+    def should_shadow(self):
+        """是否对本次请求做影子评估（发送全部工具，事后检查 top-k 的覆盖情况）"""
+        return self.shadow_rate > 0 and random.random() < self.shadow_rate
+
+    def record_shadow(self, predicted, called):
+        """记录一次影子评估：模型实际调用的工具是否都在 top-k 中"""
+        if not called:
+            return
+        with self._lock:
+            self.shadow_requests += 1
+            if set(called) <= set(predicted):
+                self.shadow_covered += 1
+
+    def evaluate(self, samples, ks=(1, 3, 5)):
+        """
+        离线评估 recall@k
+        samples: [(用户输入, [期望调用的工具名]), ...]
+        """
+        hits = {k: 0.0 for k in ks}
+        for query, expected in samples:
+            ranked = self.top_k(query, max(ks))
+            for k in ks:
+                hits[k] += len(set(expected) & set(ranked[:k])) / len(expected) if expected else 1.0
+        return {f"recall@{k}": round(hits[k] / len(samples), 4) if samples else 0.0 for k in ks}
+
+    def stats(self):
+        return {
+            "shadow_requests": self.shadow_requests,
+            "shadow_recall": round(self.shadow_covered / self.shadow_requests, 4) if self.shadow_requests else None
+        }
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# 预编译的工具 schema
+# 工具表变化（增删工具）时由 MCPContext 整体重建，之后只读，请求中直接复用，
+# 不再每次从 self.tools 重新生成 tools=[...] 列表和 required 字段
+
+import json
+import threading
+from collections import OrderedDict
+
+
+def compile_tool(tool):
+    """单个工具 -> OpenAI tools 格式"""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool["name"],
+            "description": tool["description"],
+            "parameters": {
+                "type": "object",
+                "properties": tool["parameters"],
+                "required": list(tool["parameters"].keys())
+            }
+        }
+    }
+
+
+class ToolSchema:
+    """
+    - tools: 全部工具的 schema（tuple，按注册顺序）
+    - json: tools 序列化后的 JSON 文本
+    - available_functions: tools 模块的内容；available(names) 为只包含指定工具的版本
+    - subset(names): 只包含指定工具的 schema（按名称集合缓存）
+    - tokens(counter, model, names): tools=[...] 的 JSON 文本在该模型下的 token 数（按名称集合和模型缓存）
+    """
+
+    def __init__(self, tools, version=0, max_subsets=256):
+        self.version = version
+        self.names = tuple(tools.keys())
+        self.tools = tuple(compile_tool(t) for t in tools.values())
+        self.by_name = {s["function"]["name"]: s for s in self.tools}
+        self.json = json.dumps(self.tools, ensure_ascii=False)
+        self.available_functions = {
+            "available_functions": [
+                {"name": t["name"], "description": t["description"], "parameters": t["parameters"]}
+                for t in tools.values()
+            ]
+        }
+        self.max_subsets = max_subsets
+        self._subsets = OrderedDict()
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def available(self, names=None):
+        """tools 模块的内容，names 为空时包含全部工具"""
+        if names is None:
+            return self.available_functions
+        return {"available_functions": [f for f in self.available_functions["available_functions"] if f["name"] in names]}
+
+    def subset(self, names=None):
+        """返回 (schema 列表, JSON 文本)；names 为空时返回全部工具"""
+        if names is None:
+            return list(self.tools), self.json
+        key = frozenset(names)
+        with self._lock:
+            item = self._subsets.get(key)
+            if item is not None:
+                self._subsets.move_to_end(key)
+                return item
+
+        schemas = [s for s in self.tools if s["function"]["name"] in key]
+        item = (schemas, json.dumps(schemas, ensure_ascii=False))
+        with self._lock:
+            self._subsets[key] = item
+            while len(self._subsets) > self.max_subsets:
+                self._subsets.popitem(last=False)
+        return item
+
+    def tokens(self, counter, model=None, names=None):
+        key = (None if names is None else frozenset(names), model)
+        with self._lock:
+            tokens = self._tokens.get(key)
+            if tokens is not None:
+                self._tokens.move_to_end(key)
+                return tokens
+
+        tokens = counter.count(self.subset(names)[1], model)
+        with self._lock:
+            self._tokens[key] = tokens
+            while len(self._tokens) > self.max_subsets:
+                self._tokens.popitem(last=False)
+        return tokens
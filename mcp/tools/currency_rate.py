@@ -1,8 +1,9 @@
 # mcp/tools/currency_rate.py
 
-import requests
+import asyncio
+from mcp.http import check_upstream, error_result, get_http
 
-def currency_rate(args):
+async def currency_rate(args):
     """
     使用 Frankfurter 免费 API 查询两种货币之间的汇率
     示例：USD → CNY
@@ -12,7 +13,7 @@ def currency_rate(args):
 
     url = f"https://api.frankfurter.app/latest?from={base}&to={target}"
     try:
-        res = requests.get(url, timeout=5)
+        res = check_upstream(await get_http(args).get(url, timeout=5))
         data = res.json()
 
         rate = data.get("rates", {}).get(target)
@@ -26,7 +27,7 @@ def currency_rate(args):
         else:
             return {"error": f"未找到 {target} 汇率", "base": base}
     except Exception as e:
-        return {"error": str(e), "base": base}
+        return error_result(e, base=base)
 
 
 def register(mcp):
@@ -37,20 +38,21 @@ def register(mcp):
             "base": {"type": "string", "description": "基础币种，如 USD"},
             "target": {"type": "string", "description": "目标币种，如 CNY"}
         },
-        func=currency_rate
+        func=currency_rate,
+        cache_ttl=600
     )
 
 
 # 可选测试代码
 if __name__ == "__main__":
     class MockMCP:
-        def register_tool_function(self, name, description, parameters, func):
+        def register_tool_function(self, name, description, parameters, func, **kwargs):
             print(f"注册工具函数: {name}, 描述: {description}, 参数: {parameters}")
 
     mcp = MockMCP()
     register(mcp)
-    result = currency_rate({
+    result = asyncio.run(currency_rate({
         "base": "USD",
         "target": "CNY"
-    })
+    }))
     print("调用结果：", result)
@@ -1,33 +1,129 @@
 # mcp/tools/geocode.py
 
-import requests
+import asyncio
+import re
+import unicodedata
+import yaml
+from pathlib import Path
+from mcp.cache import LRUCache, SqliteCache, ToolCache
+from mcp.http import check_upstream, error_result, get_http
+from mcp.metrics import span
+from mcp.singleflight import SingleFlight
 
-def geo_search(args):
+# 地名坐标基本不变：成功结果按规范化地名持久缓存（配置见 configs/cache.yaml 的 geocode 部分），
+# 进行中的相同查询合并为一次请求（route_plan 等插件内部调用不经过工具层的缓存和合并）
+# 每次真正请求 OpenCage 都从注入的 guard 取一个 opencage 密钥令牌，批量查询和 route_plan 同样受额度限制
+_config = None
+_cache = None
+_singleflight = SingleFlight()
+
+
+def _load_config():
+    path = Path("configs/cache.yaml")
+    config = yaml.safe_load(path.open()) if path.exists() else {}
+    return (config or {}).get("geocode") or {}
+
+
+def _geocode_cache():
+    """返回 (缓存, 配置)；首次调用时读取配置并创建缓存，之后复用"""
+    global _cache, _config
+    if _cache is None:
+        config = _load_config()
+        shared = SqliteCache(path=config["sqlite_path"]) if config.get("sqlite_path") else None
+        _cache = ToolCache(local=LRUCache(max_entries=config.get("max_entries", 4096)), shared=shared)
+        _config = config
+    return _cache, _config
+
+
+def normalize_location(location):
+    """规范化地名作为缓存键：全角转半角、忽略大小写、合并空白"""
+    text = unicodedata.normalize("NFKC", location or "").casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+
+async def _opencage(query, api_key, http):
+    with span("geocode.opencage"):
+        res = check_upstream(await http.get(
+            "https://api.opencagedata.com/geocode/v1/json",
+            params={"q": query, "key": api_key, "limit": 1},
+            timeout=5
+        ))
+    data = res.json()
+    if data["results"]:
+        result = data["results"][0]
+        return {
+            "input": query,
+            "formatted": result["formatted"],
+            "latitude": result["geometry"]["lat"],
+            "longitude": result["geometry"]["lng"],
+            "components": result["components"]
+        }
+    else:
+        return {"error": "未找到地址信息", "input": query}
+
+
+async def geocode_location(location, api_keys=None, http=None, guard=None):
+    """
+    地名 -> 经纬度，先查持久缓存；供 geo_search 和其他插件（如 route_plan）直接调用
+    guard 为框架注入的 ToolGuard，缓存未命中时每次上游请求消耗一个 opencage 令牌
+    """
+    key = normalize_location(location)
+    if not key:
+        return {"error": "缺少 location 参数", "input": location}
+
+    cache, config = _geocode_cache()
+    hit, value = await cache.aget(f"geocode:{key}")
+    if not hit:
+        api_key = (api_keys or {}).get("opencage", "")
+
+        async def lookup(_):
+            if guard is not None and not await guard.aacquire_key("opencage"):
+                return {"error": "OpenCage 触发限流，请稍后再试", "input": location}
+            try:
+                return await _opencage(location, api_key, http or get_http({}))
+            except Exception as e:
+                return error_result(e, input=location)
+
+        value = await _singleflight.ado("geocode", lookup, {"location": key})
+        if "error" not in value:
+            await cache.aset(f"geocode:{key}", value, config.get("ttl", 2592000))
+    return dict(value, input=location)
+
+
+async def geocode_many(locations, api_keys=None, http=None, concurrency=None, guard=None):
+    """批量地理编码：相同地名只查询一次，其余并发查询（最多 concurrency 个同时进行），结果与输入同序"""
+    semaphore = asyncio.Semaphore(concurrency or _geocode_cache()[1].get("batch_concurrency", 4))
+    unique = {}
+    for location in locations:
+        unique.setdefault(normalize_location(location), location)
+
+    async def one(location):
+        async with semaphore:
+            return await geocode_location(location, api_keys, http, guard)
+
+    results = await asyncio.gather(*(one(location) for location in unique.values()))
+    by_key = dict(zip(unique, results))
+    return [dict(by_key[normalize_location(location)], input=location) for location in locations]
+
+
+async def geo_search(args):
     """
     使用 OpenCage API 将地址转换为经纬度坐标
     """
-    query = args.get("location", "")
-    api_keys = args.get("__api_keys__", {})
-    api_key = api_keys.get("opencage", "")
-
-    url = f"https://api.opencagedata.com/geocode/v1/json?q={query}&key={api_key}&limit=1"
-
-    try:
-        res = requests.get(url, timeout=5)
-        data = res.json()
-        if data["results"]:
-            result = data["results"][0]
-            return {
-                "input": query,
-                "formatted": result["formatted"],
-                "latitude": result["geometry"]["lat"],
-                "longitude": result["geometry"]["lng"],
-                "components": result["components"]
-            }
-        else:
-            return {"error": "未找到地址信息", "input": query}
-    except Exception as e:
-        return {"error": str(e), "input": query}
+    return await geocode_location(
+        args.get("location", ""), args.get("__api_keys__", {}), get_http(args), args.get("__guard__")
+    )
+
+
+async def geo_search_batch(args):
+    """
+    批量将多个地址转换为经纬度坐标
+    """
+    locations = args.get("locations") or []
+    if isinstance(locations, str):
+        locations = [locations]
+    results = await geocode_many(locations, args.get("__api_keys__", {}), get_http(args), guard=args.get("__guard__"))
+    return {"results": results}
 
 
 def register(mcp):
@@ -37,7 +133,21 @@ def register(mcp):
         parameters={
             "location": {"type": "string", "description": "地址名称，如 '天安门' 或 '1600 Amphitheatre Parkway'"}
         },
-        func=geo_search
+        func=geo_search,
+        cache_ttl=86400
+    )
+    mcp.register_tool_function(
+        name="geo_search_batch",
+        description="批量将多个地址文本转换为经纬度（使用 OpenCage API）",
+        parameters={
+            "locations": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "地址名称列表，如 ['天安门', '颐和园']"
+            }
+        },
+        func=geo_search_batch,
+        cache_ttl=86400
     )
 
 
@@ -50,14 +160,14 @@ if __name__ == "__main__":
     api_keys = yaml.safe_load(api_keys_path.open()) if api_keys_path.exists() else {}
 
     class MockMCP:
-        def register_tool_function(self, name, description, parameters, func):
+        def register_tool_function(self, name, description, parameters, func, **kwargs):
             print(f"注册工具函数: {name}, 描述: {description}, 参数: {parameters}")
 
     mcp = MockMCP()
     register(mcp)
 
-    result = geo_search({
+    result = asyncio.run(geo_search({
         "location": "天安门",
         "__api_keys__": api_keys
-    })
+    }))
     print("调用结果：", result)
@@ -1,13 +1,13 @@
 # mcp/tools/ipinfo.py
 
-import requests
+from mcp.http import check_upstream, error_result, get_http
 
-def get_ip_location(args):
+async def get_ip_location(args):
     """
     使用 ipinfo.io 获取当前设备的 IP 地理位置
     """
     try:
-        res = requests.get("https://ipinfo.io/json", timeout=5)
+        res = check_upstream(await get_http(args).get("https://ipinfo.io/json", timeout=5))
         data = res.json()
         return {
             "ip": data.get("ip"),
@@ -17,7 +17,7 @@ def get_ip_location(args):
             "org": data.get("org")
         }
     except Exception as e:
-        return {"error": str(e)}
+        return error_result(e)
 
 
 def register(mcp):
@@ -28,5 +28,6 @@ def register(mcp):
         name="get_ip_location",
         description="获取当前设备的 IP 所在地信息",
         parameters={},
-        func=get_ip_location
+        func=get_ip_location,
+        cache_ttl=3600
     )
@@ -1,8 +1,9 @@
 # mcp/tools/news.py
 
-import requests
+import asyncio
+from mcp.http import check_upstream, error_result, get_http
 
-def get_news_headlines(args):
+async def get_news_headlines(args):
     """
     获取指定主题的新闻头条（来自 CurrentsAPI）
     注意：需要提供有效的 API Key
@@ -11,7 +12,7 @@ def get_news_headlines(args):
     topic = args.get("topic", "technology")
     url = f"https://api.currentsapi.services/v1/latest-news?apiKey={api_key}&category={topic}"
     try:
-        res = requests.get(url, timeout=5)
+        res = check_upstream(await get_http(args).get(url, timeout=5))
         data = res.json()
         if data.get("news"):
             return {
@@ -24,7 +25,7 @@ def get_news_headlines(args):
         else:
             return {"error": "未返回新闻数据", "topic": topic}
     except Exception as e:
-        return {"error": str(e), "topic": topic}
+        return error_result(e, topic=topic)
 
 
 def register(mcp):
@@ -38,7 +39,8 @@ def register(mcp):
             "topic": {"type": "string", "description": "新闻主题，如 technology, health"},
             "api_key": {"type": "string", "description": "你的 CurrentsAPI 密钥"}
         },
-        func=get_news_headlines
+        func=get_news_headlines,
+        cache_ttl=300
     )
 
 if __name__ == "__main__":
@@ -55,7 +57,7 @@ if __name__ == "__main__":
 
     # 虚拟 MCP 注册器（用于测试）
     class MockMCP:
-        def register_tool_function(self, name, description, parameters, func):
+        def register_tool_function(self, name, description, parameters, func, **kwargs):
             print(f"注册工具：{name}, 描述：{description}, 参数：{parameters}")
 
     mcp = MockMCP()
@@ -65,5 +67,5 @@ if __name__ == "__main__":
         "__api_keys__": api_keys,
         "topic": "technology"
     }
-    result = get_news_headlines(test_args)
+    result = asyncio.run(get_news_headlines(test_args))
     print(result)
\ No newline at end of file
@@ -1,9 +1,10 @@
 # mcp/tools/route_plan.py
 
-import requests
+import asyncio
+from mcp.http import check_upstream, error_result, get_http
 from mcp.tools import geocode
 
-def route_plan(args):
+async def route_plan(args):
     """
     查询公交路线（高德 API），需要指定 origin, destination 和 city。
     """
@@ -16,26 +17,22 @@ def route_plan(args):
     if not all([origin_text, destination, city]):
         return {"error": "必须提供 origin、destination 和 city 参数"}
 
-    # 地理编码 origin
-    origin_result = geocode.geo_search({
-        "location": f"{city} {origin_text}",
-        "__api_keys__": api_keys
-    })
+    # 起点、终点并发地理编码（结果按地名持久缓存）
+    origin_result, dst_result = await geocode.geocode_many(
+        [f"{city} {origin_text}", f"{city} {destination}"],
+        api_keys=api_keys,
+        http=get_http(args),
+        guard=args.get("__guard__")
+    )
 
-    if "latitude" not in origin_result:
-        return {"error": f"起点解析失败: {origin_result.get('error')}"}
+    for label, result in (("起点", origin_result), ("终点", dst_result)):
+        if "latitude" not in result:
+            error = {"error": f"{label}解析失败: {result.get('error')}"}
+            if result.get("upstream_error"):
+                error["upstream_error"] = True  # 地理编码服务故障，计入 route_plan 的熔断统计
+            return error
 
     from_coords = f"{origin_result['longitude']},{origin_result['latitude']}"
-
-    # 地理编码 destination
-    dst_result = geocode.geo_search({
-        "location": f"{city} {destination}",
-        "__api_keys__": api_keys
-    })
-
-    if "latitude" not in dst_result:
-        return {"error": f"终点解析失败: {dst_result.get('error')}"}
-
     to_coords = f"{dst_result['longitude']},{dst_result['latitude']}"
 
     # 请求高德公交路线 API
@@ -45,7 +42,7 @@ def route_plan(args):
     )
 
     try:
-        res = requests.get(url, timeout=8)
+        res = check_upstream(await get_http(args).get(url, timeout=8))
         data = res.json()
 
         if data.get("status") != "1" or not data.get("route", {}).get("transits"):
@@ -68,7 +65,7 @@ def route_plan(args):
         }
 
     except Exception as e:
-        return {"error": str(e)}
+        return error_result(e)
 
 def register(mcp):
     mcp.register_tool_function(
@@ -79,7 +76,8 @@ def register(mcp):
             "destination": {"type": "string", "description": "目的地名称，如 '颐和园'"},
             "city": {"type": "string", "description": "城市名称，如 '北京'"}
         },
-        func=route_plan
+        func=route_plan,
+        cache_ttl=1800
     )
 
 # 可选测试代码
@@ -91,17 +89,17 @@ if __name__ == "__main__":
     api_keys = yaml.safe_load(open("configs/api_keys.yaml"))
 
     class MockMCP:
-        def register_tool_function(self, name, description, parameters, func):
+        def register_tool_function(self, name, description, parameters, func, **kwargs):
             print(f"注册工具函数: {name}, 描述: {description}")
 
     mcp = MockMCP()
     register(mcp)
 
-    result = route_plan({
+    result = asyncio.run(route_plan({
         "origin": "望京",
         "destination": "颐和园",
         "city": "北京",
         "__api_keys__": api_keys
-    })
+    }))
 
     print("公交路线规划结果：", result)
@@ -1,15 +1,16 @@
 # mcp/tools/stock_quote.py
 
-import requests
+import asyncio
+from mcp.http import check_upstream, error_result, get_http
 
-def stock_quote(args):
+async def stock_quote(args):
     symbol = args.get("symbol", "AAPL").upper()
     api_keys = args.get("__api_keys__", {})
     api_key = api_keys.get("twelve_data", "")
 
     url = f"https://api.twelvedata.com/quote?symbol={symbol}&apikey={api_key}"
     try:
-        res = requests.get(url, timeout=5)
+        res = check_upstream(await get_http(args).get(url, timeout=5))
         data = res.json()
         print("原始 API 返回：", data)
 
@@ -30,7 +31,7 @@ def stock_quote(args):
         else:
             return {"error": data.get("message", "接口返回错误"), "symbol": symbol, "raw": data}
     except Exception as e:
-        return {"error": str(e), "symbol": symbol}
+        return error_result(e, symbol=symbol)
 
 
 
@@ -41,7 +42,8 @@ def register(mcp):
         parameters={
             "symbol": {"type": "string", "description": "股票代码，如 AAPL, TSLA, BABA"}
         },
-        func=stock_quote
+        func=stock_quote,
+        cache_ttl=30
     )
 
 
@@ -59,16 +61,16 @@ if __name__ == "__main__":
 
     # 虚拟 MCP 注册器（用于测试）
     class MockMCP:
-        def register_tool_function(self, name, description, parameters, func):
+        def register_tool_function(self, name, description, parameters, func, **kwargs):
             print(f"注册工具函数: {name}, 描述: {description}, 参数: {parameters}")
 
     mcp = MockMCP()
     register(mcp)
 
     # 调用测试函数
-    result = stock_quote({
+    result = asyncio.run(stock_quote({
         "symbol": "AAPL",
         "__api_keys__": api_keys
-    })
+    }))
     print("调用结果：", result)
 
@@ -1,15 +1,15 @@
 # mcp/tools/weather.py
 
-import requests
+from mcp.http import check_upstream, error_result, get_http
 
-def get_weather(args):
+async def get_weather(args):
     """
     查询城市天气：使用 wttr.in 提供的简易 JSON 接口
     """
     city = args["city"]
     url = f"https://wttr.in/{city}?format=j1"
     try:
-        res = requests.get(url, timeout=5)
+        res = check_upstream(await get_http(args).get(url, timeout=5))
         data = res.json()
         current = data["current_condition"][0]
         return {
@@ -19,7 +19,7 @@ def get_weather(args):
             "weather": current["weatherDesc"][0]["value"]
         }
     except Exception as e:
-        return {"error": str(e), "location": city}
+        return error_result(e, location=city)
 
 
 def register(mcp):
@@ -32,5 +32,6 @@ def register(mcp):
         parameters={
             "city": {"type": "string", "description": "城市名称，如北京、上海"}
         },
-        func=get_weather
+        func=get_weather,
+        cache_ttl=600
     )
@@ -1,15 +1,15 @@
 # mcp/tools/wikipedia.py
 
-import requests
+from mcp.http import check_upstream, error_result, get_http
 
-def search_wikipedia(args):
+async def search_wikipedia(args):
     """
     查询维基百科摘要，返回标题、简介和页面链接
     """
     query = args["query"]
     url = f"https://en.wikipedia.org/api/rest_v1/page/summary/{query}"
     try:
-        res = requests.get(url, timeout=5, headers={"User-Agent": "MCP-Agent/1.0"})
+        res = check_upstream(await get_http(args).get(url, headers={"User-Agent": "MCP-Agent/1.0"}, timeout=5))
         if res.status_code == 200:
             data = res.json()
             return {
@@ -20,7 +20,7 @@ def search_wikipedia(args):
         else:
             return {"error": f"未找到 {query} 的维基百科条目"}
     except Exception as e:
-        return {"error": str(e), "query": query}
+        return error_result(e, query=query)
 
 
 def register(mcp):
@@ -33,5 +33,6 @@ def register(mcp):
         parameters={
             "query": {"type": "string", "description": "你想搜索的维基百科词条名"}
         },
-        func=search_wikipedia
+        func=search_wikipedia,
+        cache_ttl=21600
     )
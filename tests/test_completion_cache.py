@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/completion_cache.py 与规划阶段的 llm_cache 模式（use / bypass / refresh）
+
+import asyncio
+import time
+
+from benchmarks.fake_llm import FakeLLMServer
+from benchmarks.stub_tools import register_stub_tools
+from mcp.completion_cache import CompletionCache, completion_key
+from mcp.context import MCPContext
+
+
+def test_key_ignores_transport_options():
+    kwargs = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+    assert completion_key(kwargs) == completion_key(dict(kwargs, stream=True, timeout=5))
+    assert completion_key(kwargs) != completion_key(dict(kwargs, temperature=1))
+
+
+def test_get_set_ttl_and_size_pruning(tmp_path):
+    cache = CompletionCache(path=tmp_path / "c.sqlite3", max_bytes=300, ttl=60)
+    cache.set("a", {"text": "x" * 100})
+    assert cache.get("a") == {"text": "x" * 100}
+    cache.set("b", {"text": "y" * 100})
+    time.sleep(0.01)
+    cache.get("a")  # a 最近被访问，淘汰时保留
+    cache.set("c", {"text": "z" * 100})
+    cache.prune()
+    assert cache.get("a") is not None and cache.get("b") is None
+
+    expired = CompletionCache(path=tmp_path / "e.sqlite3", ttl=0)
+    expired.set("a", {"text": "x"})
+    assert expired.get("a") is None
+
+
+def make_context(base_url, tmp_path):
+    mcp = MCPContext(api_key="sk-test", base_url=base_url)
+    mcp.completion_cache = CompletionCache(path=tmp_path / "completions.sqlite3")
+    register_stub_tools(mcp, latency=0)
+    for i in range(3):  # 模块数超过 fast_path_max_modules，走 intent_decision 调用
+        mcp.register_module(f"doc_{i}", content_fn=lambda i=i: f"资料 {i}", description=f"资料 {i}")
+    return mcp
+
+
+def test_llm_cache_modes(tmp_path):
+    with FakeLLMServer(latency=0, tool_calls=[]) as fake:
+        mcp = make_context(fake.base_url, tmp_path)
+
+        def requests(mode):
+            before = fake.requests
+            asyncio.run(mcp.abuild_prompt("北京天气怎么样", session_id=None, llm_cache=mode))
+            return fake.requests - before
+
+        assert requests("use") == 2  # intent_decision + tool_decision
+        assert requests("use") == 0
+        # refresh 和 bypass 不读任何缓存（包括模块选择决策缓存），每次都实际调用模型
+        assert requests("refresh") == 2
+        assert requests("bypass") == 2
+        assert requests("use") == 0
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/context.py：工具调用结果的注册位置
+
+import asyncio
+from types import SimpleNamespace
+
+from mcp.context import MCPContext
+
+
+def make_context():
+    mcp = MCPContext(api_key="sk-test", base_url="http://127.0.0.1:9/v1")
+    mcp.completion_cache = None
+    mcp.register_tool_function(
+        "get_weather", "查询天气", {"city": {"type": "string"}},
+        func=lambda args: {"location": args["city"], "temperature_C": "20"}
+    )
+    return mcp
+
+
+def call(name, **arguments):
+    return SimpleNamespace(name=name, arguments=arguments)
+
+
+def test_sync_handle_tool_call_without_session_reaches_generate_context():
+    mcp = make_context()
+    assert mcp.handle_tool_call(call("get_weather", city="北京")) == {"location": "北京", "temperature_C": "20"}
+    assert "tool_result_get_weather" in mcp.generate_context()
+
+
+def test_sync_handle_tool_call_uses_callers_session():
+    mcp = make_context()
+    session = mcp.new_session("北京天气", session_id=None)
+    token = session.activate()
+    try:
+        mcp.handle_tool_call(call("get_weather", city="北京"))
+    finally:
+        session.deactivate(token)
+    assert "tool_result_get_weather" in session.modules
+    assert "tool_result_get_weather" not in mcp.modules
+    assert "tool_result_get_weather" in mcp.generate_context(session)
+
+
+def reply_with(mcp, monkeypatch, content):
+    async def fake_complete(task, session=None, **kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    monkeypatch.setattr(mcp, "_acomplete", fake_complete)
+
+
+def test_single_call_planner_ignores_malformed_replies(monkeypatch):
+    mcp = make_context()
+    session = mcp.new_session("北京天气", session_id=None)
+    all_modules = list(session.modules)
+
+    reply_with(mcp, monkeypatch, '["tools"]')
+    assert asyncio.run(mcp._aplan_single_call(session)) == (all_modules, [])
+
+    reply_with(mcp, monkeypatch, '{"modules": "tools", "tool_calls": '
+                                 '[1, {"name": 5}, {"name": "get_weather", "arguments": "北京"}]}')
+    modules, tool_calls = asyncio.run(mcp._aplan_single_call(session))
+    assert modules == all_modules
+    assert [(c.name, c.arguments) for c in tool_calls] == [("get_weather", {})]
+
+
+def test_intent_decision_ignores_non_list_replies(monkeypatch):
+    mcp = make_context()
+    for i in range(3):
+        mcp.register_module(f"doc_{i}", content_fn=lambda: "资料", description=f"资料 {i}")
+    session = mcp.new_session("北京天气", session_id=None)
+    planner = {"fast_path_max_modules": 0}
+    for content in ('"tools"', "42", '{"modules": ["tools"]}'):
+        reply_with(mcp, monkeypatch, content)
+        assert asyncio.run(mcp._aselect_modules(session, planner)) == list(session.modules)
+    assert mcp.decision_cache.stats()["entries"] == 0  # 无效回复不写入决策缓存
+
+    reply_with(mcp, monkeypatch, '["tools", 3, "doc_0"]')
+    assert asyncio.run(mcp._aselect_modules(session, planner)) == ["tools", "doc_0"]
+
+
+def test_tool_calls_outside_session_tool_names_are_skipped():
+    mcp = make_context()
+    ran = []
+    mcp.register_tool_function(
+        "stock_quote", "查询股价", {"symbol": {"type": "string"}},
+        func=lambda args: ran.append(args["symbol"]) or {"price": 1}
+    )
+    session = mcp.new_session("北京天气", session_id=None, tool_names=["get_weather"])
+    results = asyncio.run(mcp.ahandle_tool_calls(
+        [call("stock_quote", symbol="AAPL"), call("get_weather", city="北京")], session=session
+    ))
+    assert ran == []
+    assert results == [{"location": "北京", "temperature_C": "20"}]
+    assert "tool_result_stock_quote" not in session.modules
+
+
+def test_tool_decision_records_schema_tokens(monkeypatch):
+    mcp = make_context()
+    calls = []
+    counter = mcp.token_counter
+    monkeypatch.setattr(counter, "count", lambda text, model=None: calls.append(model) or len(text))
+    reply = SimpleNamespace(tool_calls=None, content="")
+    async def fake_complete(task, session=None, **kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=reply)])
+    monkeypatch.setattr(mcp, "_acomplete", fake_complete)
+
+    model = mcp.router.get_model_for("tool_decision")
+    label = f'{{model="{model}"}}'
+    before = mcp.metrics.snapshot()["counters"].get("mcp_tool_schema_tokens_total", {}).get(label, 0)
+    session = mcp.new_session("北京天气", session_id=None, tool_names=["get_weather"])
+    for _ in range(2):
+        assert asyncio.run(mcp._adecide_tools(session, [])) == []
+    tokens = len(mcp.tool_schema.subset(["get_weather"])[1])
+    assert calls.count(model) == 1  # 同一模型和工具集合只计数一次
+    assert mcp.metrics.snapshot()["counters"]["mcp_tool_schema_tokens_total"][label] == before + 2 * tokens
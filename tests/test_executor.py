@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/executor.py：并发执行、结果顺序、超时与截止时间的指标
+
+import asyncio
+import time
+
+from mcp.executor import ToolExecutor
+from mcp.metrics import MetricsRegistry
+
+
+def statuses(metrics):
+    return metrics.snapshot()["counters"]["mcp_tool_calls_total"]
+
+
+def test_results_keep_call_order_and_run_concurrently():
+    executor = ToolExecutor()
+
+    async def slow(args):
+        await asyncio.sleep(args["delay"])
+        return {"delay": args["delay"]}
+
+    def sync_tool(args):
+        time.sleep(0.05)
+        return {"sync": True}
+
+    calls = [("a", slow, {"delay": 0.1}), ("b", slow, {"delay": 0.01}), ("c", sync_tool, {})]
+    start = time.perf_counter()
+    results = asyncio.run(executor.run(calls))
+    assert results == [{"delay": 0.1}, {"delay": 0.01}, {"sync": True}]
+    assert time.perf_counter() - start < 0.15
+
+
+def test_timeout_error_and_cancelled_statuses():
+    metrics = MetricsRegistry()
+    executor = ToolExecutor(call_timeout=0.05, turn_deadline=0.2, metrics=metrics)
+
+    async def hang(args):
+        await asyncio.sleep(1)
+
+    async def broken(args):
+        raise RuntimeError("boom")
+
+    async def ok(args):
+        return {"ok": True}
+
+    results = asyncio.run(executor.run([("t", hang, {}), ("e", broken, {}), ("o", ok, {})]))
+    assert "超时" in results[0]["error"] and results[1] == {"error": "boom"} and results[2] == {"ok": True}
+    counts = statuses(metrics)
+    assert counts['{status="timeout",tool="t"}'] == 1
+    assert counts['{status="error",tool="e"}'] == 1
+    assert counts['{status="ok",tool="o"}'] == 1
+
+    # 超出整轮截止时间被取消的调用记为 cancelled，而不是 ok
+    executor = ToolExecutor(call_timeout=5, turn_deadline=0.05, metrics=metrics)
+    results = asyncio.run(executor.run([("slow", hang, {})]))
+    assert "截止时间" in results[0]["error"]
+    assert statuses(metrics).get('{status="cancelled",tool="slow"}') == 1
+    assert '{status="ok",tool="slow"}' not in statuses(metrics)
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/tools/geocode.py：每次上游请求消耗一个 opencage 令牌，缓存命中不消耗
+
+import asyncio
+
+from mcp.cache import LRUCache, ToolCache
+from mcp.resilience import ToolGuard
+from mcp.tools import geocode
+
+
+def setup(monkeypatch):
+    lookups = []
+
+    async def fake_opencage(query, api_key, http):
+        lookups.append(query)
+        return {"input": query, "formatted": query, "latitude": 1.0, "longitude": 2.0, "components": {}}
+
+    monkeypatch.setattr(geocode, "_opencage", fake_opencage)
+    monkeypatch.setattr(geocode, "_cache", ToolCache(local=LRUCache()))
+    monkeypatch.setattr(geocode, "_config", {})
+    guard = ToolGuard({"defaults": {"max_wait": 0}, "api_keys": {"opencage": {"rate": 0.01, "burst": 2}}})
+    return guard, lookups
+
+
+def test_batch_lookups_draw_one_opencage_token_each(monkeypatch):
+    guard, lookups = setup(monkeypatch)
+    result = asyncio.run(geocode.geo_search_batch({
+        "locations": ["天安门", "颐和园", "故宫", "天安门"], "__guard__": guard
+    }))["results"]
+    assert len(lookups) == 2
+    assert sum("latitude" in r for r in result) == 3  # 重复的地名只查询一次
+    assert ["限流" in r.get("error", "") for r in result].count(True) == 1
+    assert not any(r.get("upstream_error") for r in result)  # 限流不计入熔断
+
+
+def test_cached_locations_do_not_consume_tokens(monkeypatch):
+    guard, lookups = setup(monkeypatch)
+    for _ in range(3):
+        result = asyncio.run(geocode.geo_search({"location": "天安门", "__guard__": guard}))
+        assert result["latitude"] == 1.0
+    assert len(lookups) == 1
+    assert guard.key_buckets["opencage"].tokens < 2 and guard.key_buckets["opencage"].tokens >= 1
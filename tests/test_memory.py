@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/memory.py：按会话隔离的环形缓冲、倒排检索、sqlite 持久化不阻塞事件循环
+
+import asyncio
+import threading
+
+from mcp.memory import MemoryStore
+
+
+def test_ring_buffer_keeps_latest_entries_per_session():
+    store = MemoryStore(max_entries=2)
+    for text in ("一", "二", "三"):
+        store.add(text, session_id="a")
+    store.add("别的会话", session_id="b")
+    assert store.get_recent(5, session_id="a") == ["二", "三"]
+    assert store.get_recent(5, session_id="b") == ["别的会话"]
+    assert store.get_recent(5, session_id="missing") == []
+
+
+def test_search_ranks_by_ngram_overlap():
+    store = MemoryStore()
+    store.add("用户说过：北京天气怎么样", session_id="a")
+    store.add("用户说过：苹果股价", session_id="a")
+    assert store.search("北京天气", k=1, session_id="a") == ["用户说过：北京天气怎么样"]
+
+
+def test_sqlite_log_survives_restart_and_skips_ephemeral(tmp_path):
+    path = str(tmp_path / "memory.db")
+    store = MemoryStore(sqlite_path=path)
+    store.add("持久", session_id="a")
+    store.add("一次性", session_id="a", persist=False)
+    assert MemoryStore(sqlite_path=path).get_recent(5, session_id="a") == ["持久"]
+
+
+def test_aadd_runs_sqlite_io_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "memory.db")
+    MemoryStore(sqlite_path=path).add("旧的", session_id="a")
+    store = MemoryStore(sqlite_path=path)
+    threads = []
+    for name in ("_read", "_write"):
+        original = getattr(store, name)
+        def spy(*args, _original=original):
+            threads.append(threading.get_ident())
+            return _original(*args)
+        setattr(store, name, spy)
+
+    async def main():
+        await store.aadd("新的", session_id="a")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 2 and loop_thread not in threads
+    assert store.get_recent(5, session_id="a") == ["旧的", "新的"]
+    assert MemoryStore(sqlite_path=path).get_recent(5, session_id="a") == ["旧的", "新的"]
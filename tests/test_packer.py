@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/packer.py：精确求解与贪心近似的切换、依赖闭包、overflow 截断
+
+import itertools
+import random
+import time
+
+from mcp.packer import dependency_closures, pack_modules, truncate_text
+
+
+def module(name, priority, tokens, deps=(), overflow=None):
+    return {"name": name, "priority": priority, "tokens": tokens, "deps": list(deps),
+            "text": "x" * tokens, "overflow": overflow}
+
+
+def count_chars(text):
+    return len(text)
+
+
+def brute_force(module_data, budget):
+    """枚举全部满足依赖闭包的子集，返回最大优先级总和"""
+    closures = dependency_closures(module_data)
+    by_name = {m["name"]: m for m in module_data}
+    best = 0
+    for size in range(len(module_data) + 1):
+        for names in itertools.combinations(by_name, size):
+            chosen = set(names)
+            if any(not closures[n] <= chosen for n in chosen):
+                continue
+            if sum(by_name[n]["tokens"] for n in chosen) <= budget:
+                best = max(best, sum(by_name[n]["priority"] for n in chosen))
+    return best
+
+
+def value(packed):
+    return sum(m["priority"] for m in packed)
+
+
+def random_modules(rng, count):
+    modules = []
+    for i in range(count):
+        deps = [f"m{j}" for j in range(i) if rng.random() < 0.15]
+        modules.append(module(f"m{i}", rng.randint(1, 5), rng.randint(1, 40), deps))
+    return modules
+
+
+def test_exact_matches_brute_force():
+    rng = random.Random(7)
+    for _ in range(200):
+        modules = random_modules(rng, rng.randint(1, 8))
+        budget = rng.randint(0, 120)
+        packed = pack_modules(modules, budget, count_chars)
+        assert value(packed) == brute_force(modules, budget)
+        assert sum(m["tokens"] for m in packed) <= budget
+
+
+def test_selection_respects_dependency_closure():
+    rng = random.Random(11)
+    for exact_limit in (16, 0):
+        for _ in range(100):
+            modules = random_modules(rng, 12)
+            packed = pack_modules(modules, rng.randint(0, 200), count_chars, exact_limit=exact_limit)
+            names = {m["name"] for m in packed}
+            closures = dependency_closures(modules)
+            assert all(closures[n] <= names for n in names)
+
+
+def test_exact_limit_switches_to_greedy():
+    # 贪心先取密度最高的 a，之后 b、c 都放不下；最优解是 b + c
+    modules = [module("a", 3, 2), module("b", 5, 5), module("c", 5, 5)]
+    exact = pack_modules(modules, 10, count_chars, exact_limit=16)
+    greedy = pack_modules(modules, 10, count_chars, exact_limit=0)
+    assert {m["name"] for m in exact} == {"b", "c"}
+    assert value(greedy) <= value(exact)
+    assert sum(m["tokens"] for m in greedy) <= 10
+
+
+def test_greedy_prefers_best_single_closure():
+    # 高密度的小模块会让贪心放不下大模块，此时应退回价值更高的单个闭包
+    modules = [module("small", 1, 1), module("big", 10, 10)]
+    packed = pack_modules(modules, 10, count_chars, exact_limit=0)
+    assert [m["name"] for m in packed] == ["big"]
+
+
+def test_overflow_truncates_into_remaining_budget():
+    modules = [module("a", 3, 40), module("b", 2, 100, overflow="truncate")]
+    packed = pack_modules(modules, 80, count_chars)
+    assert [m["name"] for m in packed] == ["a", "b"]
+    assert packed[1]["tokens"] <= 40
+    assert packed[1]["text"].endswith("（已截断）")
+
+
+def test_truncate_text_fits_budget():
+    text = "上下文" * 100
+    assert truncate_text(text, 1000, count_chars) == text
+    assert count_chars(truncate_text(text, 30, count_chars)) <= 30
+
+
+def test_exact_search_stays_fast_with_equal_priorities():
+    # 优先级相同、预算紧张时对称分支很多，分数背包上界应能把它们剪掉
+    modules = [module(f"m{i}", 1, 100 + i) for i in range(16)]
+    start = time.process_time()
+    packed = pack_modules(modules, 550, count_chars)
+    assert time.process_time() - start < 0.05
+    assert value(packed) == 5
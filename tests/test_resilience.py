@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/resilience.py：令牌桶、熔断器只统计上游故障、被拒绝时返回过期结果并归还令牌
+
+import asyncio
+
+import httpx
+
+from mcp.http import error_result
+from mcp.resilience import CircuitBreaker, ToolGuard, TokenBucket
+
+BREAKER = {"window": 30, "min_calls": 3, "error_rate": 0.5, "open_seconds": 30}
+
+
+def test_error_result_marks_only_upstream_failures():
+    request = httpx.Request("GET", "http://upstream")
+    assert error_result(httpx.ConnectError("down", request=request), q=1)["upstream_error"] is True
+    server_error = httpx.HTTPStatusError("503", request=request, response=httpx.Response(503, request=request))
+    assert error_result(server_error)["upstream_error"] is True
+    not_found = httpx.HTTPStatusError("404", request=request, response=httpx.Response(404, request=request))
+    assert "upstream_error" not in error_result(not_found)
+    assert error_result(KeyError("results")) == {"error": "'results'"}
+
+
+def test_breaker_opens_then_half_open_trial_closes():
+    breaker = CircuitBreaker(window=30, min_calls=2, error_rate=0.5, open_seconds=0)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.allow()  # open_seconds 已过，放行一次试探
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+
+def test_user_errors_do_not_open_breaker():
+    guard = ToolGuard({"breaker": BREAKER})
+    tool = guard.wrap("geo_search", lambda args: {"error": "未找到地址信息", "input": args["q"]})
+    for i in range(10):
+        tool({"q": f"不存在的地址 {i}"})
+    assert guard.stats()["geo_search"]["state"] == "closed"
+
+
+def test_upstream_errors_open_breaker_and_serve_stale():
+    guard = ToolGuard({"breaker": BREAKER})
+    state = {"down": False}
+
+    def tool(args):
+        if state["down"]:
+            return {"error": "connection refused", "upstream_error": True}
+        return {"price": 1}
+
+    wrapped = guard.wrap("stock_quote", tool)
+    assert wrapped({"symbol": "AAPL"}) == {"price": 1}
+    state["down"] = True
+    for _ in range(3):
+        wrapped({"symbol": "MSFT"})
+    assert guard.stats()["stock_quote"]["state"] == "open"
+    assert wrapped({"symbol": "AAPL"}) == {"price": 1, "stale": True}
+    assert "error" in wrapped({"symbol": "TSLA"})
+    assert guard.counters["stock_quote"]["circuit_open"] == 3  # 第 2 次失败后熔断，第 3 次 MSFT 已被拒绝
+
+
+def test_timeout_counts_as_upstream_failure():
+    guard = ToolGuard({"defaults": {"timeout": 0.01}, "breaker": dict(BREAKER, min_calls=1)})
+
+    async def slow(args):
+        await asyncio.sleep(1)
+
+    wrapped = guard.wrap("slow", slow)
+    result = asyncio.run(wrapped({}))
+    assert result["upstream_error"] is True
+    assert guard.stats()["slow"]["state"] == "open"
+
+
+def test_rejection_refunds_tokens_from_earlier_buckets():
+    guard = ToolGuard({
+        "defaults": {"max_wait": 0},
+        "tools": {"a": {"rate": 0.001, "burst": 5, "api_keys": ["shared"]}},
+        "api_keys": {"shared": {"rate": 0.001, "burst": 1}}
+    })
+    wrapped = guard.wrap("a", lambda args: {"ok": True})
+    assert wrapped({}) == {"ok": True}
+    for _ in range(3):
+        assert wrapped({}).get("stale")  # 密钥额度用完（返回过期结果），工具自己的桶不应被白白扣减
+    tool_bucket = guard.buckets["a"][0]
+    assert tool_bucket.tokens >= 3.9
+
+
+def test_circuit_open_refunds_tokens():
+    guard = ToolGuard({"tools": {"a": {"rate": 0.001, "burst": 2}}, "breaker": dict(BREAKER, min_calls=1)})
+    wrapped = guard.wrap("a", lambda args: {"error": "down", "upstream_error": True})
+    wrapped({})
+    assert guard.stats()["a"]["state"] == "open"
+    for _ in range(5):
+        wrapped({})
+    assert guard.buckets["a"][0].tokens >= 0.9
+
+
+def test_token_bucket_refund_is_capped_at_burst():
+    bucket = TokenBucket(rate=0.001, burst=1)
+    assert bucket.reserve(0) == 0.0
+    assert bucket.reserve(0) is None
+    bucket.refund()
+    bucket.refund()
+    assert bucket.tokens <= 1
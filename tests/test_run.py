@@ -4,7 +4,7 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from mcp.context import MCPContext
-from mcp.registry import register_all_plugins
+from mcp.registry import register_all_tools
 
 
 # ==== 配置你的 OpenAI Key 和 Base URL（可接 deepseek） ====
@@ -16,7 +16,7 @@ def main():
     mcp = MCPContext(api_key=OPENAI_API_KEY, base_url=BASE_URL)
 
     # 注册工具插件（自动扫描 tools 目录）
-    register_all_plugins(mcp)
+    register_all_tools(mcp)
 
     # 注册 Memory 模块
     mcp.register_module(
@@ -26,8 +26,7 @@ def main():
         description="记录用户最近的说话内容"
     )
 
-    # 注册记忆更新 Hook
-    mcp.register_hook(lambda user_input, modules: mcp.memory.add(f"用户说过：{user_input}"))
+    # build_prompt 已把每次输入写入记忆，这里不再注册重复写入的 Hook
 
     # 模拟一次用户输入
     user_input = "帮我查下北京的天气，然后告诉我它的维基百科简介"
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/singleflight.py：并发的相同调用只请求一次上游
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from mcp.singleflight import SingleFlight
+
+
+def test_async_identical_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def tool(arguments):
+        calls.append(arguments)
+        await asyncio.sleep(0.05)
+        return {"city": arguments["city"]}
+
+    wrapped = flight.wrap("weather", tool)
+
+    async def run():
+        return await asyncio.gather(*(wrapped({"city": c}) for c in ["北京"] * 5 + ["上海"] * 3))
+
+    results = asyncio.run(run())
+    assert [r["city"] for r in results] == ["北京"] * 5 + ["上海"] * 3
+    assert len(calls) == 2
+    assert flight.counters["weather"] == {"calls": 8, "shared": 6}
+    assert flight.stats()["inflight"] == 0
+
+
+def test_waiters_receive_leader_exception():
+    flight = SingleFlight()
+
+    async def tool(arguments):
+        await asyncio.sleep(0.02)
+        raise RuntimeError("上游失败")
+
+    wrapped = flight.wrap("tool", tool)
+
+    async def run():
+        return await asyncio.gather(wrapped({}), wrapped({}), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.stats()["inflight"] == 0
+
+
+def test_cancelled_waiter_does_not_cancel_upstream():
+    flight = SingleFlight()
+    calls = []
+
+    async def tool(arguments):
+        calls.append(arguments)
+        await asyncio.sleep(0.05)
+        return {"ok": True}
+
+    wrapped = flight.wrap("tool", tool)
+
+    async def run():
+        leader = asyncio.ensure_future(wrapped({}))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(wrapped({}), timeout=0.01)
+        return await leader
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert len(calls) == 1
+
+
+def test_sync_calls_coalesce_across_threads():
+    flight = SingleFlight()
+    calls = []
+
+    def tool(arguments):
+        calls.append(arguments)
+        time.sleep(0.05)
+        return {"ok": True}
+
+    wrapped = flight.wrap("tool", tool)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(wrapped({"q": 1}))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [{"ok": True}] * 4
+    assert len(calls) == 1
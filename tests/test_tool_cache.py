@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/cache.py：TTL + LRU、sqlite 共享后端、只缓存成功结果
+
+import asyncio
+import time
+
+from mcp.cache import LRUCache, SqliteCache, ToolCache, make_cache_key
+
+
+def test_cache_key_ignores_injected_arguments():
+    assert make_cache_key("t", {"city": "北京", "__api_keys__": {"a": 1}}) == make_cache_key("t", {"city": "北京"})
+    assert make_cache_key("t", {"a": 1, "b": 2}) == make_cache_key("t", {"b": 2, "a": 1})
+
+
+def test_lru_evicts_oldest_and_expires():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    cache.set("d", 4, expires_at=time.time() - 1)
+    assert cache.get("d") == (False, None)
+
+
+def test_wrap_caches_only_successful_results():
+    calls = []
+
+    def tool(arguments):
+        calls.append(arguments)
+        return {"error": "上游失败"} if arguments.get("fail") else {"ok": True}
+
+    cache = ToolCache()
+    cached = cache.wrap("tool", tool, ttl=60)
+    cached({"x": 1})
+    cached({"x": 1})
+    cached({"fail": True})
+    cached({"fail": True})
+    assert len(calls) == 3
+    assert cache.counters["tool"] == {"hits": 1, "misses": 3}
+
+
+def test_async_wrap_reads_shared_backend(tmp_path):
+    calls = []
+
+    async def tool(arguments):
+        calls.append(arguments)
+        return {"value": arguments["x"]}
+
+    shared = SqliteCache(path=tmp_path / "cache.sqlite3")
+    first = ToolCache(shared=shared).wrap("tool", tool, ttl=60)
+    # 另一个进程内缓存为空的实例（相当于另一个 worker）从共享后端命中
+    second = ToolCache(shared=shared).wrap("tool", tool, ttl=60)
+
+    async def run():
+        assert await first({"x": 1}) == {"value": 1}
+        assert await second({"x": 1}) == {"value": 1}
+
+    asyncio.run(run())
+    assert len(calls) == 1
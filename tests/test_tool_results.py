@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/tool_results.py：工具结果按轮次/TTL 过期、LRU 上限、压缩
+
+import json
+import time
+
+from mcp.tool_results import ToolResultStore, compact
+
+
+def test_results_visible_for_max_turns_after_their_turn():
+    store = ToolResultStore(max_turns=2, ttl=0)
+    turn = store.begin_turn("s")
+    store.put("s", turn, "get_weather", {"temp": 20})
+    assert store.active("s", turn) == []  # 本轮的结果由本轮直接注册，不重复返回
+    assert store.active("s", store.begin_turn("s")) == [("get_weather", {"temp": 20})]
+    assert store.active("s", store.begin_turn("s")) == [("get_weather", {"temp": 20})]
+    assert store.active("s", store.begin_turn("s")) == []
+    assert len(store) == 0
+
+
+def test_ttl_expiry_and_session_isolation():
+    store = ToolResultStore(ttl=0.01)
+    store.put("a", 1, "tool", {"v": 1})
+    assert store.active("b", 2) == []
+    time.sleep(0.02)
+    assert store.active("a", 2) == []
+
+
+def test_lru_cap_and_latest_result_per_tool():
+    store = ToolResultStore(max_entries=2, ttl=0)
+    store.put("s", 1, "a", {"v": 1})
+    store.put("s", 1, "a", {"v": 2})
+    store.put("s", 1, "b", {"v": 3})
+    store.put("s", 1, "c", {"v": 4})
+    assert dict(store.active("s", 2)) == {"b": {"v": 3}, "c": {"v": 4}}
+    store.discard("s")
+    assert len(store) == 0
+
+
+def test_compact_drops_raw_and_fits_max_chars():
+    result = {"raw": {"huge": "x" * 10000}, "items": [f"条目 {i} " * 20 for i in range(50)], "name": "ok"}
+    compacted = compact(result, max_chars=800)
+    assert "raw" not in compacted and compacted["name"] == "ok"
+    assert len(json.dumps(compacted, ensure_ascii=False)) <= 800
+    assert compact(result, max_chars=0)["items"] == result["items"]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# The code is licensed under the MIT License (MIT).
+# Author: Shibo Li
+# Date: 2026-10-18
+# mcp/tool_retriever.py 与工具预筛选：排序、召回率统计、tools 模块随 tool_names 收窄
+
+from mcp.context import MCPContext
+from mcp.tool_retriever import ToolRetriever, tokenize
+from mcp.tool_schema import ToolSchema
+
+TOOLS = {
+    "get_weather": {"name": "get_weather", "description": "查询城市天气 weather",
+                    "parameters": {"city": {"type": "string", "description": "城市名"}}},
+    "stock_quote": {"name": "stock_quote", "description": "查询股票实时股价 stock price",
+                    "parameters": {"symbol": {"type": "string", "description": "股票代码"}}},
+    "currency_rate": {"name": "currency_rate", "description": "查询两个币种之间的汇率",
+                      "parameters": {"base": {"type": "string", "description": "基准币种"}}}
+}
+
+
+def make_retriever():
+    retriever = ToolRetriever()
+    retriever.ensure_index(ToolSchema(TOOLS, version=1))
+    return retriever
+
+
+def test_tokenize_mixes_words_and_cjk_bigrams():
+    assert tokenize("Stock 股价查询") == ["stock", "股价", "价查", "查询"]
+
+
+def test_rank_puts_relevant_tool_first():
+    retriever = make_retriever()
+    assert retriever.top_k("北京天气怎么样", 1) == ["get_weather"]
+    assert retriever.top_k("苹果股价", 1) == ["stock_quote"]
+    assert retriever.evaluate([("美元汇率", ["currency_rate"])], ks=(1,)) == {"recall@1": 1.0}
+
+
+def test_shadow_recall_stats():
+    retriever = make_retriever()
+    assert retriever.stats()["shadow_recall"] is None
+    retriever.record_shadow(["get_weather"], ["get_weather"])
+    retriever.record_shadow(["get_weather"], ["stock_quote"])
+    retriever.record_shadow(["get_weather"], [])  # 没有调用工具时不计入
+    assert retriever.stats() == {"shadow_requests": 2, "shadow_recall": 0.5}
+
+
+def make_context():
+    mcp = MCPContext(api_key="sk-test", base_url="http://127.0.0.1:9/v1")
+    mcp.completion_cache = None
+    for tool in TOOLS.values():
+        mcp.register_tool_function(tool["name"], tool["description"], tool["parameters"], func=lambda args: {})
+    return mcp
+
+
+def test_tools_module_follows_tool_names():
+    mcp = make_context()
+    session = mcp.new_session("苹果股价", session_id=None, tool_names=["stock_quote"])
+    mcp._scope_tools_module(session)
+    [module] = mcp._evaluate_modules(session.modules, names=["tools"], session=session)
+    assert [f["name"] for f in module["content"]["available_functions"]] == ["stock_quote"]
+
+    # 未限定工具的请求仍列出全部工具，共享模块不受影响
+    session = mcp.new_session("苹果股价", session_id=None)
+    mcp._scope_tools_module(session)
+    [module] = mcp._evaluate_modules(session.modules, names=["tools"], session=session)
+    assert len(module["content"]["available_functions"]) == len(TOOLS)
+
+
+def test_shadow_recall_in_metrics():
+    mcp = make_context()
+    mcp.tool_retriever.record_shadow(["stock_quote"], ["stock_quote"])
+    samples = {name: values for name, _, _, values in mcp._collect_metrics()}
+    assert samples["mcp_tool_retrieval_shadow_total"] == [({}, 1)]
+    assert samples["mcp_tool_retrieval_shadow_recall"] == [({}, 1.0)]